@@ -1,8 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, Query
+from starlette.concurrency import run_in_threadpool
 from database import get_supabase
-from auth import get_current_admin_user
+from breaker import execute_async
+from auth import get_current_admin_user, get_user_from_token
+from events import bus, STORY_APPROVED, STORY_REJECTED, STORY_DELETED
+from dedup import cluster_pending, score_stored, FLAG_COLUMNS, SPAM_THRESHOLD
+from routing import routing_metrics
+from singleflight import ai_requests
 from typing import List, Optional
 from pydantic import BaseModel
+import asyncio
 import json
 
 router = APIRouter(prefix="/admin", tags=["admin"])
@@ -11,6 +18,10 @@ class StoryApproval(BaseModel):
     story_id: int
     approved: bool
 
+class ClusterAction(BaseModel):
+    story_ids: List[int]
+    action: str  # "approve" or "delete"
+
 class OrganizationCreate(BaseModel):
     name: str
     region: str
@@ -28,12 +39,33 @@ class OrganizationUpdate(BaseModel):
     website: Optional[str] = None
     is_active: Optional[bool] = None
 
+def story_payload(story: dict) -> dict:
+    """Story fields shared by the moderation API and pushed events"""
+    return {
+        "id": story["id"],
+        "title": story["title"],
+        "content": story["content"],
+        "category": story["category"],
+        "region": story.get("region"),
+        "user_id": story.get("user_id"),
+        "is_approved": story.get("is_approved", False),
+        "created_at": story.get("created_at"),
+        **{column: story.get(column) for column in FLAG_COLUMNS},
+        "is_spam": (story.get("spam_score") or 0.0) >= SPAM_THRESHOLD,
+    }
+
 @router.get("/stories/pending")
 async def get_pending_stories(current_user = Depends(get_current_admin_user)):
-    """Get all pending stories for moderation (admin only)"""
+    """Get all pending stories for moderation, grouped into near-duplicate clusters (admin only)"""
     supabase = get_supabase()
-    res = supabase.table("stories").select("*").eq("is_approved", False).execute()
+    res = await execute_async(supabase.table("stories").select("*").eq("is_approved", False))
     stories = res.data or []
+    for story in stories:
+        if story.get("spam_score") is None:
+            # Submitted before flags were stored at submission time
+            story.update(await score_stored(story))
+    grouping = cluster_pending(stories)
+    annotations = grouping["annotations"]
     
     result = []
     for story in stories:
@@ -44,38 +76,126 @@ async def get_pending_stories(current_user = Depends(get_current_admin_user)):
             "category": story["category"],
             "region": story.get("region"),
             "user_id": story["user_id"],
-            "created_at": story.get("created_at")
+            "created_at": story.get("created_at"),
+            **annotations[story["id"]],
+        })
+    
+    clusters = []
+    for cluster_id, story_ids in grouping["groups"].items():
+        clusters.append({
+            "cluster_id": cluster_id,
+            "story_ids": story_ids,
+            "size": len(story_ids),
+            "duplicate_of": next((annotations[i]["duplicate_of"] for i in story_ids if annotations[i]["duplicate_of"]), None),
+            "max_spam_score": max(annotations[i]["spam_score"] for i in story_ids),
         })
+    # Biggest and spammiest groups first, so one action clears the most work
+    clusters.sort(key=lambda c: (-c["size"], -c["max_spam_score"], c["cluster_id"]))
     
-    return {"pending_stories": result}
+    return {"pending_stories": result, "clusters": clusters}
+
+@router.post("/stories/cluster-action")
+async def act_on_cluster(cluster: ClusterAction, current_user = Depends(get_current_admin_user)):
+    """Approve or delete a group of stories at once (admin only)"""
+    # Rejecting only clears is_approved, which pending stories already have, so it would leave the group pending
+    if cluster.action not in ("approve", "delete"):
+        raise HTTPException(status_code=400, detail="Action must be approve or delete")
+    if not cluster.story_ids:
+        raise HTTPException(status_code=400, detail="No stories given")
+    supabase = get_supabase()
+    found = await execute_async(supabase.table("stories").select("*").in_("id", cluster.story_ids))
+    stories = found.data or []
+    if not stories:
+        raise HTTPException(status_code=404, detail="Stories not found")
+    ids = [story["id"] for story in stories]
+    
+    if cluster.action == "delete":
+        await execute_async(supabase.table("stories").delete().in_("id", ids))
+        for story in stories:
+            await bus.publish(STORY_DELETED, {"story": story_payload(story)})
+    else:
+        await execute_async(supabase.table("stories").update({"is_approved": True}).in_("id", ids))
+        for story in stories:
+            await bus.publish(STORY_APPROVED, {
+                "story": {**story_payload(story), "is_approved": True},
+                "was_approved": story.get("is_approved", False),
+            })
+    
+    past_tense = {"approve": "approved", "delete": "deleted"}[cluster.action]
+    return {"message": f"{len(ids)} stories {past_tense} successfully", "story_ids": ids}
 
 @router.post("/stories/approve")
 async def approve_story(approval: StoryApproval, current_user = Depends(get_current_admin_user)):
     """Approve or reject a story (admin only)"""
     supabase = get_supabase()
     # Ensure story exists
-    found = supabase.table("stories").select("id").eq("id", approval.story_id).limit(1).execute()
+    found = await execute_async(supabase.table("stories").select("*").eq("id", approval.story_id).limit(1))
     if not found.data:
         raise HTTPException(status_code=404, detail="Story not found")
-    supabase.table("stories").update({"is_approved": approval.approved}).eq("id", approval.story_id).execute()
+    await execute_async(supabase.table("stories").update({"is_approved": approval.approved}).eq("id", approval.story_id))
+    
+    story = found.data[0]
+    await bus.publish(STORY_APPROVED if approval.approved else STORY_REJECTED, {
+        "story": {**story_payload(story), "is_approved": approval.approved},
+        "was_approved": story.get("is_approved", False),
+    })
     
     return {
         "message": f"Story {'approved' if approval.approved else 'rejected'} successfully",
-        "story_id": story.id
+        "story_id": approval.story_id
     }
 
+@router.websocket("/events")
+async def moderation_events(websocket: WebSocket, token: str = Query(...)):
+    """Push story submitted/approved/rejected/deleted events to admin dashboards.
+
+    Browsers cannot set an Authorization header on a WebSocket, so the JWT is
+    passed as the ``token`` query parameter.
+    """
+    try:
+        user = await run_in_threadpool(get_user_from_token, token)
+    except HTTPException:
+        user = None
+    if not user or not user.get("is_admin", False):
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    events = bus.subscribe()
+    # Wait on the client as well as the bus, so a closed dashboard is cleaned up right away
+    receiver = asyncio.ensure_future(websocket.receive())
+    next_event = asyncio.ensure_future(events.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receiver, next_event}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                receiver = asyncio.ensure_future(websocket.receive())
+            if next_event in done:
+                await websocket.send_text(next_event.result())
+                next_event = asyncio.ensure_future(events.__anext__())
+    except (WebSocketDisconnect, RuntimeError):
+        # The client went away while we were sending
+        pass
+    finally:
+        receiver.cancel()
+        next_event.cancel()
+        await asyncio.wait({receiver, next_event})
+        await events.aclose()
+
 @router.get("/stats")
 async def get_stats(current_user = Depends(get_current_admin_user)):
     """Get application statistics (admin only)"""
     supabase = get_supabase()
-    total_stories = len((supabase.table("stories").select("id").execute().data or []))
-    approved_stories = len((supabase.table("stories").select("id").eq("is_approved", True).execute().data or []))
-    pending_stories = len((supabase.table("stories").select("id").eq("is_approved", False).execute().data or []))
-    legal_requests = len((supabase.table("legal_advice_requests").select("id").execute().data or []))
-    appeal_letters = len((supabase.table("appeal_letters").select("id").execute().data or []))
-    organizations = len((supabase.table("support_organizations").select("id").eq("is_active", True).execute().data or []))
-    total_users = len((supabase.table("users").select("id").execute().data or []))
-    admin_users = len((supabase.table("users").select("id").eq("is_admin", True).execute().data or []))
+    total_stories = len((await execute_async(supabase.table("stories").select("id"))).data or [])
+    approved_stories = len((await execute_async(supabase.table("stories").select("id").eq("is_approved", True))).data or [])
+    pending_stories = len((await execute_async(supabase.table("stories").select("id").eq("is_approved", False))).data or [])
+    legal_requests = len((await execute_async(supabase.table("legal_advice_requests").select("id"))).data or [])
+    appeal_letters = len((await execute_async(supabase.table("appeal_letters").select("id"))).data or [])
+    organizations = len((await execute_async(supabase.table("support_organizations").select("id").eq("is_active", True))).data or [])
+    total_users = len((await execute_async(supabase.table("users").select("id"))).data or [])
+    admin_users = len((await execute_async(supabase.table("users").select("id").eq("is_admin", True))).data or [])
     
     return {
         "total_stories": total_stories,
@@ -88,14 +208,59 @@ async def get_stats(current_user = Depends(get_current_admin_user)):
         "admin_users": admin_users
     }
 
+@router.get("/prompt-stats")
+async def get_prompt_stats(current_user = Depends(get_current_admin_user)):
+    """Compare latency and token usage per prompt version (admin only)"""
+    supabase = get_supabase()
+    rows = []
+    for table in ("legal_advice_requests", "appeal_letters"):
+        resp = await execute_async(supabase.table(table).select("prompt_version,prompt_tokens,completion_tokens,prompt_truncated,latency_ms"))
+        rows.extend(resp.data or [])
+    
+    grouped = {}
+    for row in rows:
+        version = row.get("prompt_version")
+        if not version:
+            continue
+        grouped.setdefault(version, []).append(row)
+    
+    result = []
+    for version, version_rows in sorted(grouped.items()):
+        latencies = sorted(r["latency_ms"] for r in version_rows if r.get("latency_ms") is not None)
+        prompt_tokens = [r["prompt_tokens"] for r in version_rows if r.get("prompt_tokens") is not None]
+        completion_tokens = [r["completion_tokens"] for r in version_rows if r.get("completion_tokens") is not None]
+        result.append({
+            "prompt_version": version,
+            "requests": len(version_rows),
+            "truncated": sum(1 for r in version_rows if r.get("prompt_truncated")),
+            "avg_latency_ms": sum(latencies) / len(latencies) if latencies else None,
+            "p95_latency_ms": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+            "avg_prompt_tokens": sum(prompt_tokens) / len(prompt_tokens) if prompt_tokens else None,
+            "avg_completion_tokens": sum(completion_tokens) / len(completion_tokens) if completion_tokens else None,
+        })
+    
+    return {"prompt_stats": result}
+
+@router.get("/routing-stats")
+async def get_routing_stats(current_user = Depends(get_current_admin_user)):
+    """Legal-advice routing decisions and estimated latency savings (admin only)"""
+    return routing_metrics.snapshot()
+
+@router.get("/dedup-stats")
+async def get_dedup_stats(current_user = Depends(get_current_admin_user)):
+    """How many AI requests were executed, joined in flight or replayed (admin only)"""
+    return ai_requests.stats
+
 @router.delete("/stories/{story_id}")
 async def delete_story(story_id: int, current_user = Depends(get_current_admin_user)):
     """Delete a story (admin only)"""
     supabase = get_supabase()
-    found = supabase.table("stories").select("id").eq("id", story_id).limit(1).execute()
+    found = await execute_async(supabase.table("stories").select("*").eq("id", story_id).limit(1))
     if not found.data:
         raise HTTPException(status_code=404, detail="Story not found")
-    supabase.table("stories").delete().eq("id", story_id).execute()
+    await execute_async(supabase.table("stories").delete().eq("id", story_id))
+    
+    await bus.publish(STORY_DELETED, {"story": story_payload(found.data[0])})
     
     return {"message": "Story deleted successfully"}
 
@@ -103,7 +268,7 @@ async def delete_story(story_id: int, current_user = Depends(get_current_admin_u
 async def get_legal_requests(current_user = Depends(get_current_admin_user)):
     """Get all legal advice requests (admin only)"""
     supabase = get_supabase()
-    resp = supabase.table("legal_advice_requests").select("*").order("created_at", desc=True).execute()
+    resp = await execute_async(supabase.table("legal_advice_requests").select("*").order("created_at", desc=True))
     requests = resp.data or []
     
     result = []
@@ -123,7 +288,7 @@ async def get_legal_requests(current_user = Depends(get_current_admin_user)):
 async def get_appeal_letters(current_user = Depends(get_current_admin_user)):
     """Get all appeal letters (admin only)"""
     supabase = get_supabase()
-    resp = supabase.table("appeal_letters").select("*").order("created_at", desc=True).execute()
+    resp = await execute_async(supabase.table("appeal_letters").select("*").order("created_at", desc=True))
     appeals = resp.data or []
     
     result = []
@@ -144,7 +309,7 @@ async def get_appeal_letters(current_user = Depends(get_current_admin_user)):
 async def get_organizations(current_user = Depends(get_current_admin_user)):
     """Get all support organizations (admin only)"""
     supabase = get_supabase()
-    resp = supabase.table("support_organizations").select("*").order("created_at", desc=True).execute()
+    resp = await execute_async(supabase.table("support_organizations").select("*").order("created_at", desc=True))
     organizations = resp.data or []
     
     result = []
@@ -167,7 +332,7 @@ async def get_organizations(current_user = Depends(get_current_admin_user)):
 async def create_organization(org_data: OrganizationCreate, current_user = Depends(get_current_admin_user)):
     """Create a new support organization (admin only)"""
     supabase = get_supabase()
-    inserted = supabase.table("support_organizations").insert({
+    inserted = await execute_async(supabase.table("support_organizations").insert({
         "name": org_data.name,
         "region": org_data.region,
         "services": org_data.services,
@@ -176,7 +341,7 @@ async def create_organization(org_data: OrganizationCreate, current_user = Depen
         "website": org_data.website,
         "created_by": current_user["id"],
         "is_active": True,
-    }, returning="representation").execute()
+    }, returning="representation"))
     if not inserted.data:
         raise HTTPException(status_code=500, detail="Failed to create organization")
     db_org = inserted.data[0]
@@ -207,10 +372,10 @@ async def update_organization(org_id: int, org_data: OrganizationUpdate, current
     if org_data.is_active is not None:
         payload["is_active"] = org_data.is_active
     # Ensure org exists
-    found = supabase.table("support_organizations").select("id").eq("id", org_id).limit(1).execute()
+    found = await execute_async(supabase.table("support_organizations").select("id").eq("id", org_id).limit(1))
     if not found.data:
         raise HTTPException(status_code=404, detail="Organization not found")
-    supabase.table("support_organizations").update(payload).eq("id", org_id).execute()
+    await execute_async(supabase.table("support_organizations").update(payload).eq("id", org_id))
     
     return {"message": "Organization updated successfully"}
 
@@ -218,10 +383,10 @@ async def update_organization(org_id: int, org_data: OrganizationUpdate, current
 async def delete_organization(org_id: int, current_user = Depends(get_current_admin_user)):
     """Delete a support organization (admin only)"""
     supabase = get_supabase()
-    found = supabase.table("support_organizations").select("id").eq("id", org_id).limit(1).execute()
+    found = await execute_async(supabase.table("support_organizations").select("id").eq("id", org_id).limit(1))
     if not found.data:
         raise HTTPException(status_code=404, detail="Organization not found")
-    supabase.table("support_organizations").delete().eq("id", org_id).execute()
+    await execute_async(supabase.table("support_organizations").delete().eq("id", org_id))
     
     return {"message": "Organization deleted successfully"}
 
@@ -229,7 +394,7 @@ async def delete_organization(org_id: int, current_user = Depends(get_current_ad
 async def get_users(current_user = Depends(get_current_admin_user)):
     """Get all users (admin only)"""
     supabase = get_supabase()
-    resp = supabase.table("users").select("*").execute()
+    resp = await execute_async(supabase.table("users").select("*"))
     users = resp.data or []
     
     result = []
@@ -5,6 +5,7 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from database import get_supabase
+from breaker import execute
 import os
 from dotenv import load_dotenv
 
@@ -50,7 +51,10 @@ def verify_token(token: str) -> Optional[dict]:
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
     """Get the current authenticated user from Supabase"""
-    token = credentials.credentials
+    return get_user_from_token(credentials.credentials)
+
+def get_user_from_token(token: str) -> Dict[str, Any]:
+    """Resolve a JWT to an active user, for callers that cannot send a Bearer header"""
     payload = verify_token(token)
 
     if payload is None:
@@ -69,7 +73,7 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         )
 
     supabase = get_supabase()
-    res = supabase.table("users").select("*").eq("id", user_id).execute()
+    res = execute(supabase.table("users").select("*").eq("id", user_id))
     data = res.data or []
     if not data:
         raise HTTPException(
@@ -99,7 +103,7 @@ def get_current_admin_user(current_user: Dict[str, Any] = Depends(get_current_us
 def authenticate_user(username: str, password: str) -> Optional[Dict[str, Any]]:
     """Authenticate a user with username and password via Supabase"""
     supabase = get_supabase()
-    res = supabase.table("users").select("*").eq("username", username).limit(1).execute()
+    res = execute(supabase.table("users").select("*").eq("username", username).limit(1))
     data = res.data or []
     if not data:
         return None
@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from database import get_supabase
+from starlette.concurrency import run_in_threadpool
+from breaker import execute_async
 from auth import get_password_hash, authenticate_user, create_access_token, get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES
 from pydantic import BaseModel
 from datetime import timedelta
@@ -32,7 +34,7 @@ async def register(user_data: UserCreate):
     """Register a new user"""
     supabase = get_supabase()
     # Check if username already exists
-    existing_user = supabase.table("users").select("id").eq("username", user_data.username).limit(1).execute()
+    existing_user = await execute_async(supabase.table("users").select("id").eq("username", user_data.username).limit(1))
     if existing_user.data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -40,7 +42,7 @@ async def register(user_data: UserCreate):
         )
     
     # Check if email already exists
-    existing_email = supabase.table("users").select("id").eq("email", user_data.email).limit(1).execute()
+    existing_email = await execute_async(supabase.table("users").select("id").eq("email", user_data.email).limit(1))
     if existing_email.data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -48,14 +50,14 @@ async def register(user_data: UserCreate):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
-    inserted = supabase.table("users").insert({
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
+    inserted = await execute_async(supabase.table("users").insert({
         "username": user_data.username,
         "email": user_data.email,
         "hashed_password": hashed_password,
         "is_admin": False,
         "is_active": True,
-    }, returning="representation").execute()
+    }, returning="representation"))
     if not inserted.data:
         raise HTTPException(status_code=500, detail="Failed to create user")
     db_user = inserted.data[0]
@@ -81,7 +83,8 @@ async def register(user_data: UserCreate):
 @router.post("/login", response_model=Token)
 async def login(user_data: UserLogin):
     """Login user"""
-    user = authenticate_user(user_data.username, user_data.password)
+    # bcrypt and the user lookup both block, so keep them off the event loop
+    user = await run_in_threadpool(authenticate_user, user_data.username, user_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
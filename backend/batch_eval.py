@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Offline batch evaluation: regenerate legal advice for historical requests.
+
+Streams descriptions out of legal_advice_requests (or an NDJSON file), renders
+them with a prompt version from prompts.py and sends them to the model with
+bounded concurrency and a requests-per-second limit. Results are appended to an
+NDJSON file (gzip if it ends in .gz). Re-running the same command resumes where
+an interrupted run stopped.
+
+    python batch_eval.py --output runs/v1.ndjson.gz --prompt-version v1 --concurrency 8 --rps 4
+
+A new prompt version has to be registered in prompts.py before --prompt-version
+can name it.
+    python batch_eval.py --input sample.ndjson --output /tmp/out.ndjson --model fake
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+from dotenv import load_dotenv
+from prompts import get_prompt
+
+load_dotenv()
+
+class RateLimiter:
+    """Token bucket shared by all workers"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+class FakeModel:
+    """Deterministic stand-in for Gemini, for dry runs and pipeline tests"""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+
+    async def generate_content_async(self, prompt: str, **kwargs) -> FakeResponse:
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        return FakeResponse(
+            "CASE CLASSIFICATION:\nfake\n\nYOUR RIGHTS:\n...\n\n"
+            f"RECOMMENDED ACTIONS:\n(prompt had {len(prompt)} characters)"
+        )
+
+def create_model(name: str):
+    if name == "fake":
+        return FakeModel()
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel(name)
+
+# Sources yield (position, row). The position is an increasing integer used for the
+# checkpoint: the row id for Supabase, the line number for a file, whose ids may be any JSON value.
+
+async def stream_from_supabase(resume_after: Optional[int], page_size: int, only_ai: bool) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """Page through legal_advice_requests in id order without loading the whole table"""
+    from database import get_supabase
+    supabase = get_supabase()
+    last_id = resume_after
+    while True:
+        query = supabase.table("legal_advice_requests").select(
+            "id,description,region,advice_generated,prompt_version"
+        ).order("id").limit(page_size)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        if only_ai:
+            query = query.eq("case_type", "classified_by_ai")
+        rows = (await asyncio.to_thread(query.execute)).data or []
+        for row in rows:
+            yield row["id"], row
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]
+
+async def stream_from_file(path: str, resume_after: Optional[int]) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """Read requests from NDJSON; rows without an id are numbered by line"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if resume_after is not None and line_number <= resume_after:
+                continue
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            row.setdefault("id", line_number)
+            yield line_number, row
+
+def open_output(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "at", encoding="utf-8")
+    return open(path, "a", encoding="utf-8")
+
+def load_completed(path: str) -> Set[Any]:
+    """Ids already written without an error, so a resumed run skips them"""
+    if not os.path.exists(path):
+        return set()
+    opener = gzip.open if path.endswith(".gz") else open
+    completed = set()
+    try:
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # A run killed mid-write can leave a partial last line
+                    continue
+                if not row.get("error"):
+                    completed.add(row["id"])
+    except EOFError:
+        # Truncated gzip stream from an interrupted run; keep what was readable
+        pass
+    return completed
+
+class Checkpoint:
+    """Tracks the highest stream position below which every streamed row is finished"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.resume_after: Optional[int] = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.resume_after = json.load(f).get("resume_after")
+        self._pending: Set[int] = set()
+        self._last_streamed: Optional[int] = self.resume_after
+
+    def started(self, position: int):
+        self._pending.add(position)
+        self._last_streamed = position
+
+    def finished(self, position: int):
+        self._pending.discard(position)
+
+    def save(self):
+        resume_after = min(self._pending) - 1 if self._pending else self._last_streamed
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"resume_after": resume_after, "saved_at": time.time()}, f)
+        os.replace(tmp, self.path)
+
+async def generate(model, prompt_text: str, limiter: RateLimiter, retries: int, timeout: float):
+    """Call the model, retrying with backoff; every attempt takes a rate limiter token.
+
+    Returns the response and the latency of the successful attempt in milliseconds.
+    """
+    for attempt in range(retries + 1):
+        await limiter.acquire()
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(model.generate_content_async(prompt_text), timeout)
+            return response, int((time.perf_counter() - started) * 1000)
+        except Exception:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(min(2 ** attempt, 30) + random.random())
+
+async def run(args: argparse.Namespace) -> Dict[str, int]:
+    template = get_prompt("legal_advice", args.prompt_version)
+    model = create_model(args.model)
+    limiter = RateLimiter(args.rps)
+    checkpoint = Checkpoint(args.output + ".ckpt")
+    completed = load_completed(args.output)
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+
+    if args.input:
+        source = stream_from_file(args.input, checkpoint.resume_after)
+    else:
+        source = stream_from_supabase(checkpoint.resume_after, args.page_size, not args.include_directory)
+
+    rows: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        streamed = 0
+        async for position, row in source:
+            if args.limit and streamed >= args.limit:
+                break
+            streamed += 1
+            if row["id"] in completed:
+                counts["skipped"] += 1
+                continue
+            checkpoint.started(position)
+            await rows.put((position, row))
+        for _ in range(args.concurrency):
+            await rows.put(None)
+
+    async def work():
+        while (item := await rows.get()) is not None:
+            position, row = item
+            prompt = template.render(description=row.get("description") or "", region=row.get("region") or "Not specified")
+            result = {
+                "id": row["id"],
+                "prompt_version": f"{prompt.name}:{prompt.version}",
+                "baseline_prompt_version": row.get("prompt_version"),
+                "prompt_tokens": prompt.tokens,
+                "prompt_truncated": bool(prompt.truncated_fields),
+            }
+            try:
+                response, latency_ms = await generate(model, prompt.text, limiter, args.retries, args.timeout)
+                usage = getattr(response, "usage_metadata", None)
+                result.update({
+                    "latency_ms": latency_ms,
+                    "prompt_tokens": getattr(usage, "prompt_token_count", None) or prompt.tokens,
+                    "completion_tokens": getattr(usage, "candidates_token_count", None),
+                    "advice": response.text,
+                })
+                if args.keep_baseline:
+                    result["baseline_advice"] = row.get("advice_generated")
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+            await results.put((position, result))
+
+    async def write():
+        last_save = time.monotonic()
+        with open_output(args.output) as out:
+            while (item := await results.get()) is not None:
+                position, result = item
+                out.write(json.dumps(result, ensure_ascii=False, separators=(",", ":")) + "\n")
+                if result.get("error"):
+                    # Left pending so the checkpoint stays below it and a resumed run retries it
+                    counts["failed"] += 1
+                else:
+                    counts["done"] += 1
+                    checkpoint.finished(position)
+                if time.monotonic() - last_save >= args.checkpoint_seconds:
+                    out.flush()
+                    checkpoint.save()
+                    last_save = time.monotonic()
+                    print(f"done={counts['done']} failed={counts['failed']} skipped={counts['skipped']}", flush=True)
+            out.flush()
+            checkpoint.save()
+
+    writer = asyncio.create_task(write())
+    await asyncio.gather(produce(), *(work() for _ in range(args.concurrency)))
+    await results.put(None)
+    await writer
+    return counts
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Regenerate legal advice for historical requests")
+    parser.add_argument("--output", required=True, help="NDJSON output file (.gz for gzip); also the resume point")
+    parser.add_argument("--input", help="Read requests from an NDJSON file instead of Supabase")
+    parser.add_argument("--model", default=os.getenv("ROUTE_MODEL_LEGAL", "gemini-1.5-flash"), help="Gemini model name, or 'fake'")
+    parser.add_argument("--prompt-version", help="legal_advice prompt version (default: the active one)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rps", type=float, default=5.0, help="Maximum model requests per second (0 for no limit)")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-call timeout in seconds")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=0, help="Stop after this many streamed rows (0 for all)")
+    parser.add_argument("--checkpoint-seconds", type=float, default=5.0)
+    parser.add_argument("--include-directory", action="store_true", help="Also re-run requests answered from the support directory")
+    parser.add_argument("--keep-baseline", action="store_true", help="Copy the stored advice next to the new one")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.monotonic()
+    counts = asyncio.run(run(args))
+    print(f"Finished in {time.monotonic() - started:.1f}s: {counts['done']} generated, "
+          f"{counts['failed']} failed, {counts['skipped']} already done")
+
+if __name__ == "__main__":
+    main()
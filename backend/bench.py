@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the production launcher.
+
+Starts serve.py with each worker count in turn, drives it with concurrent
+keep-alive requests and prints requests/second, so scaling with worker count
+can be checked on the target host:
+
+    python bench.py --workers 1 2 4 --path /api/case-stories --duration 10
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import httpx
+
+async def wait_until_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not become ready in {timeout}s")
+
+async def load(url: str, concurrency: int, duration: float) -> dict:
+    completed = 0
+    errors = 0
+    latencies = []
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        async def user():
+            nonlocal completed, errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code >= 500:
+                        errors += 1
+                    else:
+                        completed += 1
+                        latencies.append(time.perf_counter() - started)
+                except httpx.HTTPError:
+                    errors += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "rps": completed / elapsed,
+        "errors": errors,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API throughput for several worker counts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--path", default="/api/health")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--app", default="main:app")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    base = f"http://127.0.0.1:{args.port}"
+    print(f"{'workers':>7} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'speedup':>8}")
+    baseline = None
+    for workers in args.workers:
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--app", args.app, "--workers", str(workers),
+             "--host", "127.0.0.1", "--port", str(args.port), "--allow-local-events"],
+            cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            asyncio.run(wait_until_ready(base + args.path))
+            if args.warmup:
+                asyncio.run(load(base + args.path, args.concurrency, args.warmup))
+            result = asyncio.run(load(base + args.path, args.concurrency, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+        baseline = baseline or result["rps"]
+        print(f"{workers:>7} {result['rps']:>10.1f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+              f"{result['errors']:>7} {result['rps'] / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
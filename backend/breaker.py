@@ -0,0 +1,182 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from postgrest.exceptions import APIError
+from google.api_core.exceptions import ClientError, TooManyRequests
+from google.generativeai.types import BlockedPromptException, StopCandidateException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+
+class CircuitOpenError(HTTPException):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail=f"{name} is temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+class CircuitBreaker:
+    """Stop calling a failing dependency and probe it again after a cool-down.
+
+    closed: calls go through, consecutive failures are counted.
+    open: calls fail fast with CircuitOpenError until reset_timeout has passed.
+    half_open: up to half_open_max_calls probe calls go through; a success closes
+    the breaker and a failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        is_failure: Callable[[Exception], bool] = lambda exc: True,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def check(self):
+        """Fail fast while the breaker is open, without using up a half-open probe"""
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, remaining)
+
+    def before_call(self):
+        """Reserve a call, raising CircuitOpenError if the dependency should not be tried"""
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, remaining)
+                self._state = self.HALF_OPEN
+                self._probes = 0
+            if self._state == self.HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    raise CircuitOpenError(self.name, 1)
+                self._probes += 1
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call fn through the breaker"""
+        self.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as exc:
+            if self.is_failure(exc):
+                self.record_failure()
+            else:
+                # The dependency answered, it just said no
+                self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            failures = self._failures
+        return {
+            "state": self.state,
+            "consecutive_failures": failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+        }
+
+def gemini_is_failure(exc: Exception) -> bool:
+    """Only outages count: a 4xx or a blocked prompt is about that one request"""
+    if isinstance(exc, TooManyRequests):
+        # Quota and rate limits are shared by every user
+        return True
+    return not isinstance(exc, (ClientError, BlockedPromptException, StopCandidateException))
+
+gemini_breaker = CircuitBreaker(
+    "AI service",
+    failure_threshold=int(os.getenv("GEMINI_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30")),
+    is_failure=gemini_is_failure,
+)
+
+supabase_breaker = CircuitBreaker(
+    "Database",
+    failure_threshold=int(os.getenv("SUPABASE_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("SUPABASE_BREAKER_RESET_SECONDS", "15")),
+    # PostgREST errors (constraint violations, bad filters) mean the database is up
+    is_failure=lambda exc: not isinstance(exc, APIError),
+)
+
+def execute(query):
+    """Execute a Supabase query through the Supabase breaker"""
+    return supabase_breaker.call(query.execute)
+
+async def execute_async(query):
+    """Execute a Supabase query through the breaker in a worker thread, off the event loop"""
+    return await run_in_threadpool(execute, query)
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    return {
+        "gemini": gemini_breaker.snapshot(),
+        "supabase": supabase_breaker.snapshot(),
+    }
+
+class SnapshotCache:
+    """Last good response per key, served while a dependency is unavailable"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            return self._entries.get(key)
+
+snapshots = SnapshotCache()
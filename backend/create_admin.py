@@ -1,57 +1,223 @@
 #!/usr/bin/env python3
 """
 Script to create admin users for Netsanet
-Run this script to create additional admin users.
+Run this script to create additional admin users interactively, or provision
+many accounts at once from a CSV or NDJSON file:
+
+    python create_admin.py
+    python create_admin.py --file partners.csv
+    python create_admin.py --file admins.ndjson --admin
+
+A .json file holds a JSON array of objects; .ndjson/.jsonl hold one object per line.
+Each row needs username, email and password; an optional is_admin column
+overrides --admin per row. Passwords are hashed in parallel across a process
+pool, usernames and emails that already exist are skipped, and new users are
+inserted in batches.
 """
 
-from database import SessionLocal
-from models import User
+import argparse
+import csv
+import getpass
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Set, Tuple
+from database import get_supabase
 from auth import get_password_hash
 
+TRUTHY = ("1", "true", "yes", "y")
+# Keeps PostgREST filter URLs and insert payloads at a reasonable size
+LOOKUP_CHUNK = 200
+
 def create_admin_user(username: str, email: str, password: str):
     """Create a new admin user"""
-    db = SessionLocal()
-    
+    supabase = get_supabase()
+
     try:
         # Check if user already exists
-        existing_user = db.query(User).filter(User.username == username).first()
-        if existing_user:
+        existing_user = supabase.table("users").select("id").eq("username", username).limit(1).execute()
+        if existing_user.data:
             print(f"User '{username}' already exists!")
             return
-        
+        existing_email = supabase.table("users").select("id").eq("email", email).limit(1).execute()
+        if existing_email.data:
+            print(f"Email '{email}' is already registered!")
+            return
+
         # Create admin user
-        admin_user = User(
-            username=username,
-            email=email,
-            hashed_password=get_password_hash(password),
-            is_admin=True,
-            is_active=True
-        )
-        
-        db.add(admin_user)
-        db.commit()
-        
+        supabase.table("users").insert({
+            "username": username,
+            "email": email,
+            "hashed_password": get_password_hash(password),
+            "is_admin": True,
+            "is_active": True,
+        }).execute()
+
         print(f"Admin user created successfully!")
         print(f"   Username: {username}")
         print(f"   Email: {email}")
-        print(f"   Password: {password}")
         print(f"   Role: Admin")
-        
+
     except Exception as e:
         print(f"Error creating admin user: {e}")
-        db.rollback()
-    finally:
-        db.close()
 
-if __name__ == "__main__":
+def read_users(path: str) -> List[Dict[str, Any]]:
+    """Read user rows from a .csv, a .json array or a .ndjson/.jsonl file"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            rows = json.load(f)
+            if not isinstance(rows, list):
+                raise ValueError(f"{path} must contain a JSON array of users")
+            return rows
+        if path.endswith((".ndjson", ".jsonl")):
+            return [json.loads(line) for line in f if line.strip()]
+        return list(csv.DictReader(f))
+
+def validate(rows: Iterable[Dict[str, Any]], default_admin: bool) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Normalize rows and drop incomplete ones or ones repeated within the file"""
+    users, problems = [], []
+    seen_usernames: Set[str] = set()
+    seen_emails: Set[str] = set()
+    for number, row in enumerate(rows, start=1):
+        username = (row.get("username") or "").strip()
+        email = (row.get("email") or "").strip()
+        password = row.get("password") or ""
+        if not username or not email or not password:
+            problems.append(f"row {number}: username, email and password are required")
+            continue
+        if username in seen_usernames or email in seen_emails:
+            problems.append(f"row {number}: '{username}' / '{email}' repeats an earlier row")
+            continue
+        seen_usernames.add(username)
+        seen_emails.add(email)
+        is_admin = row.get("is_admin")
+        users.append({
+            "username": username,
+            "email": email,
+            "password": password,
+            "is_admin": default_admin if is_admin in (None, "") else str(is_admin).strip().lower() in TRUTHY,
+        })
+    return users, problems
+
+def _chunks(items: List[Any], size: int) -> Iterable[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def existing_values(column: str, values: List[str]) -> Set[str]:
+    """Which of the given usernames or emails are already in the users table"""
+    supabase = get_supabase()
+    found: Set[str] = set()
+    for chunk in _chunks(values, LOOKUP_CHUNK):
+        res = supabase.table("users").select(column).in_(column, chunk).execute()
+        found.update(row[column] for row in (res.data or []))
+    return found
+
+def find_conflicts(users: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Split users into new ones and ones whose username or email is taken"""
+    taken_usernames = existing_values("username", [u["username"] for u in users])
+    taken_emails = existing_values("email", [u["email"] for u in users])
+    new_users, conflicts = [], []
+    for user in users:
+        if user["username"] in taken_usernames:
+            conflicts.append(f"username '{user['username']}' already exists")
+        elif user["email"] in taken_emails:
+            conflicts.append(f"email '{user['email']}' is already registered")
+        else:
+            new_users.append(user)
+    return new_users, conflicts
+
+def hash_passwords(passwords: List[str], processes: int) -> List[str]:
+    """bcrypt is deliberately slow, so spread it across CPU cores"""
+    if processes <= 1 or len(passwords) < 2:
+        return [get_password_hash(p) for p in passwords]
+    chunksize = max(1, len(passwords) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(get_password_hash, passwords, chunksize=chunksize))
+
+def insert_users(users: List[Dict[str, Any]], batch_size: int) -> Tuple[int, List[str]]:
+    """Insert users in batches; if a batch is rejected, retry its rows one by one"""
+    supabase = get_supabase()
+    created, failures = 0, []
+    for batch in _chunks(users, batch_size):
+        try:
+            supabase.table("users").insert(batch).execute()
+            created += len(batch)
+            continue
+        except Exception:
+            # Usually a username/email registered since the conflict check
+            pass
+        for user in batch:
+            try:
+                supabase.table("users").insert(user).execute()
+                created += 1
+            except Exception as e:
+                failures.append(f"'{user['username']}': {e}")
+    return created, failures
+
+def provision_users(path: str, default_admin: bool, processes: int, batch_size: int, dry_run: bool = False) -> Dict[str, Any]:
+    """Create every new user listed in a CSV/NDJSON file"""
+    started = time.monotonic()
+    users, problems = validate(read_users(path), default_admin)
+    new_users, conflicts = find_conflicts(users)
+    report = {"invalid": problems, "skipped": conflicts, "failed": [], "created": 0}
+    if dry_run or not new_users:
+        report["would_create"] = len(new_users)
+        return report
+
+    hashed = hash_passwords([u["password"] for u in new_users], processes)
+    rows = [
+        {
+            "username": user["username"],
+            "email": user["email"],
+            "hashed_password": hashed_password,
+            "is_admin": user["is_admin"],
+            "is_active": True,
+        }
+        for user, hashed_password in zip(new_users, hashed)
+    ]
+    report["created"], report["failed"] = insert_users(rows, batch_size)
+    report["seconds"] = round(time.monotonic() - started, 1)
+    return report
+
+def interactive():
     print("Netsanet Admin User Creator")
     print("=" * 40)
-    
+
     username = input("Enter username: ")
     email = input("Enter email: ")
-    password = input("Enter password: ")
-    
+    password = getpass.getpass("Enter password: ")
+
     if username and email and password:
         create_admin_user(username, email, password)
     else:
-        print("All fields are required!") 
\ No newline at end of file
+        print("All fields are required!")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create Netsanet users and admins")
+    parser.add_argument("--file", help="CSV, JSON array or NDJSON file with username, email, password[, is_admin]")
+    parser.add_argument("--admin", action="store_true", help="Make users admins unless the row says otherwise")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Processes used to hash passwords")
+    parser.add_argument("--batch-size", type=int, default=500, help="Users per insert request")
+    parser.add_argument("--dry-run", action="store_true", help="Only validate and check for conflicts")
+    args = parser.parse_args(argv)
+
+    if not args.file:
+        interactive()
+        return
+
+    report = provision_users(args.file, args.admin, args.processes, args.batch_size, args.dry_run)
+    for label in ("invalid", "skipped", "failed"):
+        for message in report[label]:
+            print(f"{label}: {message}")
+    if args.dry_run:
+        print(f"Dry run: {report['would_create']} users would be created")
+    else:
+        print(f"Created {report['created']} users in {report.get('seconds', 0)}s "
+              f"({len(report['skipped'])} already existed, {len(report['invalid'])} invalid, {len(report['failed'])} failed)")
+    if report["failed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
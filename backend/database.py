@@ -1,17 +1,22 @@
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
 
 # Load env from backend/.env before reading variables
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# Fail slow queries quickly so the Supabase circuit breaker can open; postgrest's own default is 120s
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10"))
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("SUPABASE configuration missing. Set SUPABASE_URL to https://<project>.supabase.co and SUPABASE_KEY.")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Client = create_client(
+    SUPABASE_URL, SUPABASE_KEY,
+    options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT_SECONDS),
+)
 
 def get_supabase() -> Client:
     return supabase
\ No newline at end of file
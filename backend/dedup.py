@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+from database import get_supabase
+from breaker import execute
+from events import bus, STORY_SUBMITTED, STORY_DELETED
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+LSH_BANDS = 16  # 16 bands of 8 rows: pairs above ~0.7 Jaccard almost always share a bucket
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.8"))
+SPAM_THRESHOLD = float(os.getenv("SPAM_THRESHOLD", "0.6"))
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32, so a * h + b fits in uint64
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_BASE = np.uint64(1000003)
+
+# Fixed seed so every worker computes identical signatures
+_rng = np.random.RandomState(20240101)
+_PERM_A = _rng.randint(1, 2 ** 32 - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 2 ** 32 - 1, size=NUM_PERM, dtype=np.uint64)
+_BASE_POWERS = _BASE ** np.arange(SHINGLE_SIZE, dtype=np.uint64)[::-1]
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_URL_RE = re.compile(r"https?://|www\.", re.IGNORECASE)
+_REPEAT_RE = re.compile(r"(.)\1{6,}")
+SPAM_TERMS = (
+    "casino", "viagra", "bitcoin", "crypto", "forex", "loan offer", "click here",
+    "buy now", "free money", "whatsapp me", "telegram me", "earn money", "investment opportunity",
+)
+
+def normalize(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", text.lower()).strip()
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """32-bit hashes of every character SHINGLE_SIZE-gram, computed in one vectorized pass"""
+    codes = np.frombuffer(normalize(text).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if codes.size < SHINGLE_SIZE:
+        codes = np.pad(codes, (0, SHINGLE_SIZE - codes.size))
+    windows = np.lib.stride_tricks.sliding_window_view(codes, SHINGLE_SIZE)
+    # Polynomial hash of each window; uint64 overflow wraps, which is fine for hashing
+    hashes = (windows * _BASE_POWERS).sum(axis=1, dtype=np.uint64)
+    return np.unique((hashes ^ (hashes >> np.uint64(32))) & _MAX_HASH)
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature of NUM_PERM uint32 values"""
+    hashes = shingle_hashes(text)
+    permuted = (_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+def spam_score(title: str, content: str) -> Tuple[float, List[str]]:
+    """Cheap heuristics for obvious spam; returns a 0..1 score and the reasons"""
+    text = f"{title} {content}"
+    lowered = text.lower()
+    flags = []
+    if len(_URL_RE.findall(text)) >= 2:
+        flags.append("links")
+    if any(term in lowered for term in SPAM_TERMS):
+        flags.append("spam_terms")
+    if _REPEAT_RE.search(text):
+        flags.append("repeated_characters")
+    letters = sum(ch.isalpha() for ch in text)
+    if text.strip() and letters / len(text) < 0.5:
+        flags.append("few_letters")
+    if len(content.strip()) < 40:
+        flags.append("too_short")
+    words = lowered.split()
+    if len(words) >= 20 and len(set(words)) / len(words) < 0.3:
+        flags.append("repetitive")
+    weights = {"links": 0.4, "spam_terms": 0.5, "repeated_characters": 0.2, "few_letters": 0.3, "too_short": 0.2, "repetitive": 0.3}
+    return min(1.0, sum(weights[f] for f in flags)), flags
+
+class StoryIndex:
+    """MinHash signatures of all stories with an LSH index for near-duplicate lookup"""
+
+    def __init__(self, bands: int = LSH_BANDS):
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self._signatures: Dict[Any, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, set]] = [{} for _ in range(bands)]
+        self.loaded = False
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, story: Dict[str, Any]):
+        story_id = story["id"]
+        if story_id in self._signatures:
+            return
+        signature = minhash(f"{story.get('title', '')}\n{story.get('content', '')}")
+        self._signatures[story_id] = signature
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            band.setdefault(key, set()).add(story_id)
+
+    def remove(self, story_id: Any):
+        signature = self._signatures.pop(story_id, None)
+        if signature is None:
+            return
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            ids = band.get(key)
+            if ids is not None:
+                ids.discard(story_id)
+                if not ids:
+                    del band[key]
+
+    def load(self, stories: List[Dict[str, Any]]):
+        self.__init__(self.bands)
+        for story in stories:
+            self.add(story)
+        self.loaded = True
+
+    def similar(self, story_id: Any, threshold: float = DUPLICATE_THRESHOLD) -> List[Tuple[Any, float]]:
+        """Indexed stories whose estimated Jaccard similarity is at least threshold, best first"""
+        signature = self._signatures.get(story_id)
+        if signature is None:
+            return []
+        return self._matches(signature, threshold, exclude=story_id)
+
+    def similar_text(self, title: str, content: str, threshold: float = DUPLICATE_THRESHOLD) -> List[Tuple[Any, float]]:
+        """Like similar, for a story that is not indexed yet"""
+        return self._matches(minhash(f"{title}\n{content}"), threshold)
+
+    def _matches(self, signature: np.ndarray, threshold: float, exclude: Any = None) -> List[Tuple[Any, float]]:
+        candidates = set()
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            candidates |= band.get(key, set())
+        candidates.discard(exclude)
+        if not candidates:
+            return []
+        ids = list(candidates)
+        matrix = np.stack([self._signatures[i] for i in ids])
+        scores = (matrix == signature).mean(axis=1)
+        keep = np.nonzero(scores >= threshold)[0]
+        return sorted(((ids[i], float(scores[i])) for i in keep), key=lambda pair: -pair[1])
+
+    async def handle_event(self, message: str):
+        event = json.loads(message)
+        story = event.get("data", {}).get("story")
+        if not story:
+            return
+        if event["type"] == STORY_SUBMITTED:
+            self.add(story)
+        elif event["type"] == STORY_DELETED:
+            self.remove(story["id"])
+
+FLAG_COLUMNS = ("duplicate_of", "similarity", "spam_score", "spam_flags")
+
+def flags_from_matches(matches: List[Tuple[Any, float]], title: str, content: str) -> Dict[str, Any]:
+    """Columns stored on a story: its closest near-duplicate and its spam score"""
+    score, flags = spam_score(title, content)
+    return {
+        "duplicate_of": matches[0][0] if matches else None,
+        "similarity": round(matches[0][1], 3) if matches else None,
+        "spam_score": round(score, 2),
+        "spam_flags": flags,
+    }
+
+def cluster_pending(stories: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Group pending stories by their stored duplicate_of links and annotate them"""
+    ids = {story["id"] for story in stories}
+    parent = {story_id: story_id for story_id in ids}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for story in stories:
+        other = story.get("duplicate_of")
+        if other in ids:
+            a, b = find(story["id"]), find(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    annotations, groups = {}, {}
+    for story in sorted(stories, key=lambda s: s["id"]):
+        other = story.get("duplicate_of")
+        score = story.get("spam_score") or 0.0
+        root = find(story["id"])
+        annotations[story["id"]] = {
+            # Links inside the pending set are shown as the cluster; outside ones point to the original
+            "duplicate_of": other if other is not None and other not in ids else None,
+            "similarity": story.get("similarity") if other is not None and other not in ids else None,
+            "spam_score": score,
+            "spam_flags": story.get("spam_flags") or [],
+            "is_spam": score >= SPAM_THRESHOLD,
+            "cluster_id": root,
+        }
+        groups.setdefault(root, []).append(story["id"])
+    return {"annotations": annotations, "groups": groups}
+
+story_index = StoryIndex()
+bus.add_listener(story_index.handle_event)
+
+async def score_submission(title: str, content: str) -> Dict[str, Any]:
+    """Flags for a new story, matched against every existing story"""
+    if not story_index.loaded:
+        await load_story_index()
+    matches = story_index.similar_text(title, content)
+    return flags_from_matches(matches, title, content)
+
+async def score_stored(story: Dict[str, Any]) -> Dict[str, Any]:
+    """Flags for a story saved before submissions were scored"""
+    if not story_index.loaded:
+        await load_story_index()
+    story_index.add(story)
+    return flags_from_matches(story_index.similar(story["id"]), story.get("title", ""), story.get("content", ""))
+
+async def load_story_index() -> bool:
+    """Build the index from every story in Supabase; returns False if the database is unavailable"""
+    try:
+        query = get_supabase().table("stories").select("id,title,content")
+        rows = (await run_in_threadpool(execute, query)).data or []
+    except Exception:
+        logger.exception("Could not load the story duplicate index")
+        return False
+    await run_in_threadpool(story_index.load, rows)
+    return True
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Event types pushed to admin dashboards
+STORY_SUBMITTED = "story.submitted"
+STORY_APPROVED = "story.approved"
+STORY_REJECTED = "story.rejected"
+STORY_DELETED = "story.deleted"
+
+# Leave empty for a single worker; set to redis://host:6379/0 to fan out across workers
+EVENT_BROKER_URL = os.getenv("EVENT_BROKER_URL", "")
+EVENT_CHANNEL = os.getenv("EVENT_CHANNEL", "netsanet:moderation")
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("EVENT_SUBSCRIBER_QUEUE_SIZE", "100"))
+# Backoff between attempts to resubscribe after the Redis connection drops
+RECONNECT_MIN_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 30.0
+
+Deliver = Callable[[str], Awaitable[None]]
+
+class LocalBroker:
+    """Delivers messages within this process only"""
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def publish(self, message: str):
+        await self._deliver(message)
+
+    async def stop(self):
+        pass
+
+class RedisBroker:
+    """Fans messages out to every worker through Redis pub/sub"""
+
+    def __init__(self, url: str, channel: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("EVENT_BROKER_URL points to Redis but the 'redis' package is not installed. Run: pip install redis")
+        self._redis = redis.from_url(url)
+        self.channel = channel
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver):
+        # Subscribe once up front so an unreachable Redis is reported at startup
+        pubsub = await self._subscribe()
+        self._task = asyncio.create_task(self._listen_forever(pubsub, deliver))
+
+    async def _subscribe(self):
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        return pubsub
+
+    async def _listen_forever(self, pubsub, deliver: Deliver):
+        """Listen, and resubscribe with backoff whenever the connection drops"""
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = await self._subscribe()
+                    logger.info("Reconnected to the event broker")
+                    delay = RECONNECT_MIN_SECONDS
+                async for item in pubsub.listen():
+                    if item.get("type") == "message":
+                        data = item["data"]
+                        await deliver(data.decode("utf-8") if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Lost the event broker connection; retrying in %.1fs", delay)
+            if pubsub is not None:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+                pubsub = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    async def publish(self, message: str):
+        await self._redis.publish(self.channel, message)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        await self._redis.close()
+
+def create_broker(url: str = EVENT_BROKER_URL):
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBroker(url, EVENT_CHANNEL)
+    return LocalBroker()
+
+class EventBus:
+    """In-process pub/sub; every subscriber gets its own bounded queue"""
+
+    def __init__(self, broker=None):
+        self.broker = broker or LocalBroker()
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._listeners: List[Deliver] = []
+        self._started = False
+
+    async def start(self):
+        if not self._started:
+            await self.broker.start(self._deliver)
+            self._started = True
+
+    async def start_or_fallback(self):
+        """Start the broker, falling back to in-process delivery if it is unreachable"""
+        try:
+            await self.start()
+        except Exception:
+            # Pushes are best effort, so an unreachable Redis must not keep the API from starting
+            logger.exception("Event broker unavailable; delivering events within this worker only")
+            self.broker = LocalBroker()
+            await self.start()
+
+    async def stop(self):
+        if self._started:
+            await self.broker.stop()
+            self._started = False
+
+    async def publish(self, event_type: str, data: Dict[str, Any]):
+        """Publish an event to subscribers on every worker"""
+        message = json.dumps({
+            "id": uuid.uuid4().hex,
+            "type": event_type,
+            "data": data,
+            "ts": time.time(),
+        }, default=str)
+        try:
+            if not self._started:
+                await self.start()
+            await self.broker.publish(message)
+        except Exception:
+            # Dashboards can always reload; never fail a moderation action over a missed push
+            logger.exception("Failed to publish %s event", event_type)
+
+    def add_listener(self, listener: Deliver):
+        """Call listener with every message, for in-process consumers such as caches"""
+        self._listeners.append(listener)
+
+    async def _deliver(self, message: str):
+        for listener in self._listeners:
+            try:
+                await listener(message)
+            except Exception:
+                logger.exception("Event listener failed")
+        for queue in list(self._subscribers):
+            if queue.full():
+                # A slow dashboard loses its oldest events rather than blocking everyone
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """Yield raw JSON messages until the caller stops iterating"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+bus = EventBus(create_broker())
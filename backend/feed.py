@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+from database import get_supabase
+from breaker import execute
+from events import bus, STORY_APPROVED, STORY_REJECTED, STORY_DELETED
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Full reload from the database to pick up edits made outside the API; 0 disables it
+FEED_REFRESH_SECONDS = float(os.getenv("FEED_REFRESH_SECONDS", "300"))
+# Cheap check of which story ids are approved, so approvals and takedowns made on
+# another worker show up even without a shared event broker; 0 disables it
+FEED_CHECK_SECONDS = float(os.getenv("FEED_CHECK_SECONDS", "10"))
+FEED_MAX_VIEWS = int(os.getenv("FEED_MAX_VIEWS", "512"))
+
+def public_story(story: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape of a story in the public /api/case-stories feed"""
+    return {
+        "id": story["id"],
+        "title": story["title"],
+        "content": story["content"],
+        "category": story["category"],
+        "region": story.get("region"),
+        "outcome": "positive",
+        "is_approved": True,
+    }
+
+class StoryFeed:
+    """Approved stories kept in memory, partitioned by category and region.
+
+    Filtered views are built on first use and cached until the next change, so
+    serving the public feed needs no database queries.
+    """
+
+    def __init__(self):
+        self._stories: Dict[Any, Dict[str, Any]] = {}
+        self._by_category: Dict[str, Set[Any]] = {}
+        self._by_region: Dict[str, Set[Any]] = {}
+        # (category, region) -> (stories, content digest)
+        self._views: Dict[Tuple[Optional[str], Optional[str]], Tuple[List[Dict[str, Any]], str]] = {}
+        self.loaded = False
+
+    def load(self, rows: List[Dict[str, Any]]):
+        """Replace the whole feed with approved rows from the database"""
+        self._stories = {}
+        self._by_category = {}
+        self._by_region = {}
+        for row in rows:
+            if row.get("is_approved", False):
+                self._add(public_story(row))
+        self.loaded = True
+        self._changed()
+
+    def upsert(self, story: Dict[str, Any]):
+        self._remove(story["id"])
+        self._add(public_story(story))
+        self._changed()
+
+    def remove(self, story_id: Any):
+        if self._remove(story_id):
+            self._changed()
+
+    def _add(self, story: Dict[str, Any]):
+        self._stories[story["id"]] = story
+        self._by_category.setdefault(story["category"], set()).add(story["id"])
+        self._by_region.setdefault((story.get("region") or "").lower(), set()).add(story["id"])
+
+    def _remove(self, story_id: Any) -> bool:
+        story = self._stories.pop(story_id, None)
+        if story is None:
+            return False
+        for index, key in ((self._by_category, story["category"]), (self._by_region, (story.get("region") or "").lower())):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(story_id)
+                if not ids:
+                    del index[key]
+        return True
+
+    def _changed(self):
+        self._views.clear()
+
+    def ids(self) -> Set[Any]:
+        return set(self._stories)
+
+    def view(self, category: Optional[str] = None, region: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Approved stories matching the filters, with the same semantics as the database query"""
+        return self._view(category, region)[0]
+
+    def _view(self, category: Optional[str], region: Optional[str]) -> Tuple[List[Dict[str, Any]], str]:
+        key = (category, region)
+        cached = self._views.get(key)
+        if cached is not None:
+            return cached
+
+        ids: Optional[Set[Any]] = None
+        if category:
+            ids = set(self._by_category.get(category, ()))
+        if region:
+            # Same as ilike '%region%': any region containing the text, case-insensitively
+            needle = region.lower()
+            matching = set().union(*(ids_ for name, ids_ in self._by_region.items() if needle in name))
+            ids = matching if ids is None else ids & matching
+        if ids is None:
+            ids = set(self._stories)
+        stories = [self._stories[story_id] for story_id in sorted(ids)]
+        # Hash of the content, so every worker and every restart agrees on the ETag
+        content = [(s["id"], s["title"], s["content"], s["category"], s.get("region")) for s in stories]
+        digest = hashlib.sha1(json.dumps(content, default=str).encode("utf-8")).hexdigest()
+
+        if len(self._views) >= FEED_MAX_VIEWS:
+            self._views.clear()
+        self._views[key] = (stories, digest)
+        return self._views[key]
+
+    def etag(self, category: Optional[str], region: Optional[str], offset: int, limit: Optional[int]) -> str:
+        """ETag of one page of a view, derived from the stories it contains"""
+        digest = self._view(category, region)[1]
+        page = hashlib.sha1(json.dumps([digest, offset, limit]).encode("utf-8")).hexdigest()[:16]
+        return f'W/"stories-{page}"'
+
+    async def handle_event(self, message: str):
+        """Apply a moderation event from the event bus"""
+        event = json.loads(message)
+        story = event.get("data", {}).get("story")
+        if not story:
+            return
+        if event["type"] == STORY_APPROVED:
+            self.upsert(story)
+        elif event["type"] in (STORY_REJECTED, STORY_DELETED):
+            self.remove(story["id"])
+
+story_feed = StoryFeed()
+bus.add_listener(story_feed.handle_event)
+
+async def load_story_feed() -> bool:
+    """Load approved stories from Supabase; returns False if the database is unavailable"""
+    try:
+        query = get_supabase().table("stories").select("*").eq("is_approved", True)
+        rows = (await run_in_threadpool(execute, query)).data or []
+    except Exception:
+        logger.exception("Could not load the story feed")
+        return False
+    story_feed.load(rows)
+    return True
+
+async def story_feed_is_stale() -> bool:
+    """Whether the set of approved story ids in the database differs from the feed"""
+    try:
+        query = get_supabase().table("stories").select("id").eq("is_approved", True)
+        rows = (await run_in_threadpool(execute, query)).data or []
+    except Exception:
+        return False
+    return {row["id"] for row in rows} != story_feed.ids()
+
+async def refresh_story_feed_forever():
+    intervals = [s for s in (FEED_CHECK_SECONDS, FEED_REFRESH_SECONDS) if s > 0]
+    if not intervals:
+        return
+    tick = min(intervals)
+    since_reload = 0.0
+    while True:
+        await asyncio.sleep(tick)
+        since_reload += tick
+        if FEED_REFRESH_SECONDS > 0 and since_reload >= FEED_REFRESH_SECONDS:
+            since_reload = 0.0
+            await load_story_feed()
+        elif FEED_CHECK_SECONDS > 0 and await story_feed_is_stale():
+            since_reload = 0.0
+            await load_story_feed()
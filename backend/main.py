@@ -1,14 +1,28 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response, Query
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
+import asyncio
 import json
 import re
+import time
 from database import get_supabase
-from admin import router as admin_router
+from prompts import get_prompt, RenderedPrompt
+from breaker import execute, execute_async, gemini_breaker, breaker_states, snapshots, GEMINI_TIMEOUT_SECONDS
+from events import bus, STORY_SUBMITTED, STORY_APPROVED
+from feed import story_feed, load_story_feed, refresh_story_feed_forever
+from dedup import load_story_index, score_submission, story_index
+from singleflight import ai_requests, request_fingerprint, dedup_key
+from routing import (
+    classify_case, detect_region, rank_organizations, format_directory_answer,
+    routing_metrics, ROUTE_DIRECTORY, ROUTE_APPEAL, ROUTE_MODELS,
+)
+from admin import router as admin_router, story_payload
 from auth_routes import router as auth_router
 from auth import get_current_user, get_current_admin_user
 
@@ -18,6 +32,13 @@ load_dotenv()
 # Configure Gemini API
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 model = genai.GenerativeModel('gemini-1.5-flash')
+_models: Dict[str, Any] = {'gemini-1.5-flash': model}
+
+def get_model(name: str):
+    """Get a Gemini model by name, creating it on first use"""
+    if name not in _models:
+        _models[name] = genai.GenerativeModel(name)
+    return _models[name]
 
 supabase = get_supabase()
 
@@ -40,6 +61,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_event_bus():
+    await bus.start_or_fallback()
+
+@app.on_event("startup")
+async def load_public_feed():
+    # Materialize the public story feed; if the database is down it is loaded on first request
+    await load_story_feed()
+    asyncio.create_task(refresh_story_feed_forever())
+
+@app.on_event("startup")
+async def load_duplicate_index():
+    # Signatures of existing stories, so submissions are matched against them
+    await load_story_index()
+
+@app.on_event("shutdown")
+async def stop_event_bus():
+    await bus.stop()
+
+@app.on_event("shutdown")
+async def drain_ai_requests():
+    # Let running Gemini generations finish and store their rows before the worker exits;
+    # serve.py sets this to the part of GRACEFUL_TIMEOUT left after open requests finish
+    await ai_requests.drain(float(os.getenv("AI_DRAIN_SECONDS", "15")))
+
 # Include routers
 app.include_router(auth_router)
 app.include_router(admin_router)
@@ -64,106 +110,162 @@ class StorySubmission(BaseModel):
     category: str
     region: Optional[str] = None
 
+def prompt_usage(prompt: RenderedPrompt, response, latency_ms: int) -> Dict[str, Any]:
+    """Columns recording which prompt version was used and what it cost"""
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "prompt_version": f"{prompt.name}:{prompt.version}",
+        "prompt_tokens": getattr(usage, "prompt_token_count", None) or prompt.tokens,
+        "completion_tokens": getattr(usage, "candidates_token_count", None),
+        "prompt_truncated": bool(prompt.truncated_fields),
+        "latency_ms": latency_ms,
+    }
+
+def answer_from_directory(case: CaseDescription, current_user: Dict[str, Any], started: float) -> Dict[str, Any]:
+    """Answer a directory-style question from support_organizations without calling the LLM"""
+    try:
+        region = case.region or detect_region(case.description)
+        query = supabase.table("support_organizations").select("*").eq("is_active", True)
+        if region:
+            query = query.ilike("region", f"%{region}%")
+        organizations = rank_organizations(execute(query).data or [], case.description)[:5]
+        advice = format_directory_answer(organizations, region)
+        latency_ms = int((time.perf_counter() - started) * 1000)
+        
+        execute(supabase.table("legal_advice_requests").insert({
+            "description": case.description,
+            "region": case.region,
+            "advice_generated": advice,
+            "case_type": "support_directory",
+            "user_id": current_user["id"],
+            "latency_ms": latency_ms,
+        }))
+        routing_metrics.record(ROUTE_DIRECTORY, latency_ms)
+        
+        return {
+            "advice": advice,
+            "case_type": "support_directory",
+            "route": ROUTE_DIRECTORY,
+            "organizations": [
+                {
+                    "name": org["name"],
+                    "region": org["region"],
+                    "services": org.get("services") or [],
+                    "contact": org["contact"],
+                    "address": org["address"],
+                    "website": org.get("website"),
+                }
+                for org in organizations
+            ],
+            "timestamp": "2024-01-01T00:00:00Z"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error looking up support organizations: {str(e)}")
+
 @app.get("/")
 async def root():
     return {"message": "Netsanet API - Supporting Women in Ethiopia"}
 
 @app.post("/api/legal-advice")
-async def get_legal_advice(case: CaseDescription, current_user: Dict[str, Any] = Depends(get_current_user)):
+async def get_legal_advice(
+    case: CaseDescription,
+    current_user: Dict[str, Any] = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+):
     """Get AI-powered legal advice based on case description"""
+    # Double submits and retries share one generation and one stored row
+    fingerprint = request_fingerprint(case.dict())
+    key = dedup_key("legal-advice", current_user["id"], fingerprint, idempotency_key)
+    return await ai_requests.do(key, fingerprint, lambda: create_legal_advice(case, current_user))
+
+async def create_legal_advice(case: CaseDescription, current_user: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    decision = classify_case(case.description)
+    if decision.route == ROUTE_DIRECTORY:
+        return await run_in_threadpool(answer_from_directory, case, current_user, started)
+    
     if not model:
         raise HTTPException(
             status_code=503,
             detail="AI service not available. Please configure GEMINI_API_KEY in the .env file. Get your API key from: https://makersuite.google.com/app/apikey"
         )
+    gemini_breaker.check()
     
     try:
-        prompt = f"""
-        You are a legal advisor specializing in Ethiopian law and women's rights. 
-        Based on the Ethiopian Constitution and relevant laws, provide clear, actionable guidance for this case.
-        
-        Case Description: {case.description}
-        Region: {case.region or 'Not specified'}
-        
-        Provide structured advice in the following format:
-        
-        CASE CLASSIFICATION:
-        [Classify the case type]
-        
-        YOUR RIGHTS:
-        [List relevant rights under Ethiopian Constitution and laws]
-        
-        RECOMMENDED ACTIONS:
-        [Step-by-step actions the person can take]
-        
-        LEGAL CONSIDERATIONS:
-        [Important legal points to consider]
-        
-        EMERGENCY CONTACTS:
-        [Relevant emergency contacts if needed]
-        
-        Be supportive, clear, and provide practical advice. Focus on Ethiopian legal context. Do not include any introductory text or explanations outside of the structured format above.
-        """
+        prompt = get_prompt("legal_advice").render(
+            description=case.description,
+            region=case.region or 'Not specified',
+        )
         
-        response = model.generate_content(prompt)
+        llm_started = time.perf_counter()
+        response = await run_in_threadpool(
+            gemini_breaker.call, get_model(decision.model).generate_content, prompt.text,
+            request_options={"timeout": GEMINI_TIMEOUT_SECONDS},
+        )
+        latency_ms = int((time.perf_counter() - llm_started) * 1000)
         advice = response.text
         
         # Store the request in Supabase with user_id
-        supabase.table("legal_advice_requests").insert({
+        await execute_async(supabase.table("legal_advice_requests").insert({
             "description": case.description,
             "region": case.region,
             "advice_generated": advice,
             "case_type": "classified_by_ai",
             "user_id": current_user["id"],
-        }).execute()
+            **prompt_usage(prompt, response, latency_ms),
+        }))
+        
+        routing_metrics.record(decision.route, (time.perf_counter() - started) * 1000)
         
         return {
             "advice": advice,
             "case_type": "classified_by_ai",
+            "route": decision.route,
             "timestamp": "2024-01-01T00:00:00Z"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating legal advice: {str(e)}")
 
 @app.post("/api/generate-appeal")
-async def generate_appeal(form: AppealForm, current_user: Dict[str, Any] = Depends(get_current_user)):
+async def generate_appeal(
+    form: AppealForm,
+    current_user: Dict[str, Any] = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+):
     """Generate a formal appeal letter using AI"""
+    fingerprint = request_fingerprint(form.dict())
+    key = dedup_key("generate-appeal", current_user["id"], fingerprint, idempotency_key)
+    return await ai_requests.do(key, fingerprint, lambda: create_appeal_letter(form, current_user))
+
+async def create_appeal_letter(form: AppealForm, current_user: Dict[str, Any]) -> Dict[str, Any]:
     if not model:
         raise HTTPException(
             status_code=503,
             detail="AI service not available. Please configure GEMINI_API_KEY in the .env file. Get your API key from: https://makersuite.google.com/app/apikey"
         )
+    gemini_breaker.check()
     
     try:
-        prompt = f"""
-        Generate ONLY a formal appeal letter in both Amharic and English for the following case. Do not include any explanations, introductions, or additional text - just the letter content.
-
-        Case Details:
-        Name: {form.name}
-        Case Type: {form.case_type}
-        Incident Date: {form.incident_date}
-        Location: {form.location}
-        Description: {form.description}
-        Evidence: {form.evidence or 'Not provided'}
-        Contact Information: {form.contact_info}
-        
-        Requirements:
-        - Write a formal, professional appeal letter
-        - Include relevant Ethiopian legal references
-        - Clearly state the complaint and requested actions
-        - Follow proper legal letter format
-        - Provide BOTH English and Amharic versions
-        
-        Format your response EXACTLY as follows (no other text):
-        
-        ENGLISH VERSION:
-        [Complete English appeal letter with proper formatting]
-        
-        AMHARIC VERSION:
-        [Complete Amharic appeal letter with proper formatting]
-        """
+        prompt = get_prompt("appeal_letter").render(
+            name=form.name,
+            case_type=form.case_type,
+            incident_date=form.incident_date,
+            location=form.location,
+            description=form.description,
+            evidence=form.evidence or 'Not provided',
+            contact_info=form.contact_info,
+        )
         
-        response = model.generate_content(prompt)
+        started = time.perf_counter()
+        response = await run_in_threadpool(
+            gemini_breaker.call, get_model(ROUTE_MODELS[ROUTE_APPEAL]).generate_content, prompt.text,
+            request_options={"timeout": GEMINI_TIMEOUT_SECONDS},
+        )
+        latency_ms = int((time.perf_counter() - started) * 1000)
         appeal_letter = response.text
         
         # Parse the response to separate English and Amharic versions
@@ -174,7 +276,7 @@ async def generate_appeal(form: AppealForm, current_user: Dict[str, Any] = Depen
         amharic_letter = amharic_match.group(1).strip() if amharic_match else ""
         
         # Store the appeal letter in Supabase with user_id
-        supabase.table("appeal_letters").insert({
+        await execute_async(supabase.table("appeal_letters").insert({
             "name": form.name,
             "case_type": form.case_type,
             "incident_date": form.incident_date,
@@ -185,13 +287,16 @@ async def generate_appeal(form: AppealForm, current_user: Dict[str, Any] = Depen
             "english_letter": english_letter,
             "amharic_letter": amharic_letter,
             "user_id": current_user["id"],
-        }).execute()
+            **prompt_usage(prompt, response, latency_ms),
+        }))
         
         return {
             "appeal_letter": appeal_letter,
             "generated_at": "2024-01-01T00:00:00Z",
             "case_details": form.dict()
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating appeal letter: {str(e)}")
 
@@ -201,7 +306,15 @@ async def get_support_organizations(region: Optional[str] = None):
     query = supabase.table("support_organizations").select("*").eq("is_active", True)
     if region:
         query = query.ilike("region", f"%{region}%")
-    organizations = (query.execute().data) or []
+    snapshot_key = ("support_organizations", region)
+    try:
+        organizations = (await execute_async(query)).data or []
+    except Exception:
+        # Degraded mode: serve the last good directory while the database is unavailable
+        cached = snapshots.get(snapshot_key)
+        if cached is None:
+            raise
+        return {**cached, "degraded": True}
     
     result = []
     for org in organizations:
@@ -214,17 +327,42 @@ async def get_support_organizations(region: Optional[str] = None):
             "website": org.get("website"),
         })
     
-    return {"organizations": result}
+    response = {"organizations": result}
+    snapshots.put(snapshot_key, response)
+    return response
 
 @app.get("/api/case-stories")
-async def get_case_stories(category: Optional[str] = None, region: Optional[str] = None):
+async def get_case_stories(
+    request: Request,
+    category: Optional[str] = None,
+    region: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+):
     """Get case stories, optionally filtered by category or region"""
+    # Served from the in-memory feed, which moderation events keep up to date
+    if story_feed.loaded or await load_story_feed():
+        etag = story_feed.etag(category, region, offset, limit)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        stories = story_feed.view(category, region)
+        page = stories[offset:offset + limit] if limit is not None else stories[offset:]
+        return JSONResponse({"stories": page, "total": len(stories)}, headers=headers)
+    
     query = supabase.table("stories").select("*").eq("is_approved", True)
     if category:
         query = query.eq("category", category)
     if region:
         query = query.ilike("region", f"%{region}%")
-    stories = (query.execute().data) or []
+    snapshot_key = ("case_stories", category, region)
+    try:
+        stories = (await execute_async(query)).data or []
+    except Exception:
+        cached = snapshots.get(snapshot_key)
+        if cached is None:
+            raise
+        return {**cached, "degraded": True}
     
     result = []
     for story in stories:
@@ -238,21 +376,29 @@ async def get_case_stories(category: Optional[str] = None, region: Optional[str]
             "is_approved": story.get("is_approved", False)
         })
     
-    return {"stories": result}
+    response = {"stories": result, "total": len(result)}
+    snapshots.put(snapshot_key, response)
+    return response
 
 @app.post("/api/submit-story")
 async def submit_story(story: StorySubmission, current_user: Dict[str, Any] = Depends(get_current_user)):
     """Submit an anonymous story"""
     try:
-        inserted = supabase.table("stories").insert({
+        # Flag near-duplicates and spam now, so moderation only has to group stored results
+        flags = await score_submission(story.title, story.content)
+        inserted = await execute_async(supabase.table("stories").insert({
             "title": story.title,
             "content": story.content,
             "category": story.category,
             "region": story.region,
             "is_approved": False,
             "user_id": current_user["id"],
-        }, returning="representation").execute()
+            **flags,
+        }, returning="representation"))
         db_story_id = inserted.data[0]["id"] if inserted.data else None
+        if inserted.data:
+            story_index.add(inserted.data[0])
+            await bus.publish(STORY_SUBMITTED, {"story": story_payload(inserted.data[0])})
         
         return {
             "message": "Story submitted successfully and is pending approval",
@@ -266,7 +412,7 @@ async def submit_story(story: StorySubmission, current_user: Dict[str, Any] = De
 @app.get("/api/my/stories")
 async def get_my_stories(current_user: Dict[str, Any] = Depends(get_current_user)):
     """Get current user's stories"""
-    stories = (supabase.table("stories").select("*").eq("user_id", current_user["id"]).execute().data) or []
+    stories = (await execute_async(supabase.table("stories").select("*").eq("user_id", current_user["id"]))).data or []
     
     result = []
     for story in stories:
@@ -285,7 +431,7 @@ async def get_my_stories(current_user: Dict[str, Any] = Depends(get_current_user
 @app.get("/api/my/legal-advice")
 async def get_my_legal_advice(current_user: Dict[str, Any] = Depends(get_current_user)):
     """Get current user's legal advice history"""
-    requests = (supabase.table("legal_advice_requests").select("*").eq("user_id", current_user["id"]).order("created_at", desc=True).execute().data) or []
+    requests = (await execute_async(supabase.table("legal_advice_requests").select("*").eq("user_id", current_user["id"]).order("created_at", desc=True))).data or []
     
     result = []
     for req in requests:
@@ -303,7 +449,7 @@ async def get_my_legal_advice(current_user: Dict[str, Any] = Depends(get_current
 @app.get("/api/my/appeal-letters")
 async def get_my_appeal_letters(current_user: Dict[str, Any] = Depends(get_current_user)):
     """Get current user's appeal letters"""
-    appeals = (supabase.table("appeal_letters").select("*").eq("user_id", current_user["id"]).order("created_at", desc=True).execute().data) or []
+    appeals = (await execute_async(supabase.table("appeal_letters").select("*").eq("user_id", current_user["id"]).order("created_at", desc=True))).data or []
     
     result = []
     for appeal in appeals:
@@ -322,20 +468,28 @@ async def get_my_appeal_letters(current_user: Dict[str, Any] = Depends(get_curre
 @app.post("/api/approve-story/{story_id}")
 async def approve_story(story_id: int, current_user: Dict[str, Any] = Depends(get_current_admin_user)):
     """Approve a story (admin only)"""
-    found = supabase.table("stories").select("id").eq("id", story_id).limit(1).execute()
+    found = await execute_async(supabase.table("stories").select("*").eq("id", story_id).limit(1))
     if not found.data:
         raise HTTPException(status_code=404, detail="Story not found")
-    supabase.table("stories").update({"is_approved": True}).eq("id", story_id).execute()
+    await execute_async(supabase.table("stories").update({"is_approved": True}).eq("id", story_id))
+    
+    story = found.data[0]
+    await bus.publish(STORY_APPROVED, {
+        "story": {**story_payload(story), "is_approved": True},
+        "was_approved": story.get("is_approved", False),
+    })
     
     return {
         "message": "Story approved successfully",
-        "story_id": story.id
+        "story_id": story_id
     }
 
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "Netsanet API"}
+    breakers = breaker_states()
+    degraded = any(b["state"] != "closed" for b in breakers.values())
+    return {"status": "degraded" if degraded else "healthy", "service": "Netsanet API", "breakers": breakers}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,195 @@
+import os
+import re
+import string
+import textwrap
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Token budget for a fully rendered prompt (template text + user input)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2048"))
+# Cap for a field that is not truncatable and has no cap of its own in field_caps
+SHORT_FIELD_TOKEN_CAP = int(os.getenv("SHORT_FIELD_TOKEN_CAP", "64"))
+TRUNCATION_MARKER = " [...]"
+
+# Words (including Ethiopic script) count as one token, punctuation as one each.
+# This is a cheap local approximation; the exact count from Gemini is recorded
+# separately from the response usage metadata.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of tokens in a piece of text"""
+    return sum(1 for _ in _TOKEN_RE.finditer(text))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """Cut text down to at most max_tokens tokens, returning (text, was_truncated)"""
+    keep = max_tokens - count_tokens(TRUNCATION_MARKER)
+    if keep <= 0:
+        return "", bool(text)
+    end = None
+    for i, match in enumerate(_TOKEN_RE.finditer(text)):
+        if i == keep:
+            return text[:end].rstrip() + TRUNCATION_MARKER, True
+        end = match.end()
+    return text, False
+
+@dataclass(frozen=True)
+class RenderedPrompt:
+    name: str
+    version: str
+    text: str
+    tokens: int
+    truncated_fields: Tuple[str, ...]
+
+class PromptTemplate:
+    """A versioned prompt, split into literal chunks and fields once at load time.
+
+    Truncatable fields share whatever the budget leaves; every other field is cut
+    to its entry in field_caps (SHORT_FIELD_TOKEN_CAP by default).
+    """
+
+    def __init__(self, name: str, version: str, template: str, truncatable: Tuple[str, ...] = (),
+                 field_caps: Optional[Dict[str, int]] = None):
+        self.name = name
+        self.version = version
+        self.truncatable = truncatable
+        self.field_caps = field_caps or {}
+        self._chunks: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in string.Formatter().parse(textwrap.dedent(template).strip())
+        ]
+        self.fields = tuple(field for _, field in self._chunks if field)
+        self.fixed_tokens = sum(count_tokens(literal) for literal, _ in self._chunks)
+
+    def render(self, budget: Optional[int] = None, **values: str) -> RenderedPrompt:
+        """Fill in the template, truncating long fields so the prompt fits the token budget"""
+        budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+        values = {field: str(values[field]) for field in self.fields}
+        sizes = {field: count_tokens(value) for field, value in values.items()}
+        truncated = []
+
+        for field in values:
+            if field in self.truncatable:
+                continue
+            cap = self.field_caps.get(field, SHORT_FIELD_TOKEN_CAP)
+            if sizes[field] > cap:
+                values[field], _ = truncate_to_tokens(values[field], cap)
+                sizes[field] = count_tokens(values[field])
+                truncated.append(field)
+
+        # Squeeze the truncatable fields first; only a budget too small for the
+        # capped short fields falls back to cutting every field
+        for candidates in (self.truncatable, self.fields):
+            if self.fixed_tokens + sum(sizes.values()) <= budget:
+                break
+            # Share what is left of the budget between the candidates,
+            # smallest first, so short fields are kept whole
+            remaining = budget - self.fixed_tokens - sum(
+                size for field, size in sizes.items() if field not in candidates
+            )
+            ordered = sorted(dict.fromkeys(candidates), key=lambda f: sizes[f])
+            for i, field in enumerate(ordered):
+                share = max(remaining // (len(ordered) - i), 0)
+                if sizes[field] > share:
+                    values[field], _ = truncate_to_tokens(values[field], share)
+                    sizes[field] = count_tokens(values[field])
+                    if field not in truncated:
+                        truncated.append(field)
+                remaining -= sizes[field]
+
+        total = self.fixed_tokens + sum(sizes.values())
+        text = "".join(literal + (values[field] if field else "") for literal, field in self._chunks)
+        return RenderedPrompt(self.name, self.version, text, total, tuple(truncated))
+
+# Registry of all prompt versions: name -> version -> template
+_registry: Dict[str, Dict[str, PromptTemplate]] = {}
+_defaults: Dict[str, str] = {}
+
+def register(template: PromptTemplate, default: bool = False) -> PromptTemplate:
+    """Add a prompt version to the registry"""
+    _registry.setdefault(template.name, {})[template.version] = template
+    if default or template.name not in _defaults:
+        _defaults[template.name] = template.version
+    return template
+
+def get_prompt(name: str, version: Optional[str] = None) -> PromptTemplate:
+    """Look up a prompt, using PROMPT_VERSION_<NAME> from the environment to pin a version"""
+    versions = _registry.get(name)
+    if not versions:
+        raise KeyError(f"Unknown prompt '{name}'")
+    version = version or os.getenv(f"PROMPT_VERSION_{name.upper()}") or _defaults[name]
+    if version not in versions:
+        raise KeyError(f"Unknown version '{version}' for prompt '{name}'")
+    return versions[version]
+
+def list_prompts() -> Dict[str, List[str]]:
+    """List registered prompt names and their versions"""
+    return {name: sorted(versions) for name, versions in _registry.items()}
+
+register(PromptTemplate(
+    name="legal_advice",
+    version="v1",
+    truncatable=("description",),
+    field_caps={"region": 16},
+    template="""
+        You are a legal advisor specializing in Ethiopian law and women's rights.
+        Based on the Ethiopian Constitution and relevant laws, provide clear, actionable guidance for this case.
+
+        Case Description: {description}
+        Region: {region}
+
+        Provide structured advice in the following format:
+
+        CASE CLASSIFICATION:
+        [Classify the case type]
+
+        YOUR RIGHTS:
+        [List relevant rights under Ethiopian Constitution and laws]
+
+        RECOMMENDED ACTIONS:
+        [Step-by-step actions the person can take]
+
+        LEGAL CONSIDERATIONS:
+        [Important legal points to consider]
+
+        EMERGENCY CONTACTS:
+        [Relevant emergency contacts if needed]
+
+        Be supportive, clear, and provide practical advice. Focus on Ethiopian legal context. Do not include any introductory text or explanations outside of the structured format above.
+        """,
+))
+
+register(PromptTemplate(
+    name="appeal_letter",
+    version="v1",
+    truncatable=("description", "evidence"),
+    field_caps={"name": 32, "case_type": 32, "incident_date": 16, "location": 48, "contact_info": 64},
+    template="""
+        Generate ONLY a formal appeal letter in both Amharic and English for the following case. Do not include any explanations, introductions, or additional text - just the letter content.
+
+        Case Details:
+        Name: {name}
+        Case Type: {case_type}
+        Incident Date: {incident_date}
+        Location: {location}
+        Description: {description}
+        Evidence: {evidence}
+        Contact Information: {contact_info}
+
+        Requirements:
+        - Write a formal, professional appeal letter
+        - Include relevant Ethiopian legal references
+        - Clearly state the complaint and requested actions
+        - Follow proper legal letter format
+        - Provide BOTH English and Amharic versions
+
+        Format your response EXACTLY as follows (no other text):
+
+        ENGLISH VERSION:
+        [Complete English appeal letter with proper formatting]
+
+        AMHARIC VERSION:
+        [Complete Amharic appeal letter with proper formatting]
+        """,
+))
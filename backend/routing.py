@@ -0,0 +1,229 @@
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Any
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ROUTE_DIRECTORY = "directory"
+ROUTE_LEGAL = "legal"
+ROUTE_APPEAL = "appeal"
+
+# Model used by each LLM-backed route; the directory route is answered locally
+ROUTE_MODELS = {
+    ROUTE_LEGAL: os.getenv("ROUTE_MODEL_LEGAL", "gemini-1.5-flash"),
+    ROUTE_APPEAL: os.getenv("ROUTE_MODEL_APPEAL", "gemini-1.5-flash"),
+}
+
+ROUTING_ENABLED = os.getenv("ROUTING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Only short questions are considered for the directory route; case narratives always go to the LLM
+DIRECTORY_MAX_WORDS = int(os.getenv("ROUTING_DIRECTORY_MAX_WORDS", "30"))
+DIRECTORY_MIN_MARGIN = float(os.getenv("ROUTING_DIRECTORY_MIN_MARGIN", "0.15"))
+# A question that looks like a case at all (legal score above this) always goes to the LLM
+DIRECTORY_MAX_LEGAL_SCORE = float(os.getenv("ROUTING_DIRECTORY_MAX_LEGAL_SCORE", "0.2"))
+
+# Facts of a case: a question mentioning any of these is never answered from the directory
+CASE_FACT_RE = re.compile(
+    r"\b(rap(e|ed|es|ing|ist)|beat(s|en|ing)?|hit(s|ting)?|threat\w*|kill\w*|abus\w*|assault\w*|"
+    r"harass\w*|forced|kidnap\w*|traffick\w*|violen\w*|stalk\w*|attack\w*|molest\w*|hurt\w*|"
+    r"injur\w*|touch(es|ed|ing)|pregnan\w*|fired|evict\w*|custody|divorc\w*|inherit\w*)\b",
+    re.IGNORECASE,
+)
+
+ETHIOPIAN_REGIONS = [
+    "addis ababa", "afar", "amhara", "benishangul", "dire dawa", "gambela", "harari",
+    "oromia", "sidama", "somali", "south west", "southern", "tigray",
+]
+
+# Seed examples for the TF-IDF classifier
+_SEED_EXAMPLES = {
+    ROUTE_DIRECTORY: [
+        "where is the nearest shelter",
+        "where can i find a safe house",
+        "is there a women's shelter near me",
+        "phone number for legal aid",
+        "contact of an organization that helps women",
+        "list of support organizations in my region",
+        "where can i get free legal aid",
+        "which organizations offer counseling",
+        "address of the nearest legal aid office",
+        "who can i call for help near me",
+        "find a lawyer near me",
+        "hotline number for abuse victims",
+    ],
+    ROUTE_LEGAL: [
+        "my husband beats me and threatens to take the children",
+        "my employer fired me because i am pregnant",
+        "i was harassed at work by my manager",
+        "my family forced me into marriage when i was young",
+        "my husband took our property after the divorce",
+        "i was denied my inheritance because i am a woman",
+        "what are my rights if my husband abandons me",
+        "can i get custody of my children",
+        "i was raped and the police did not open a case",
+        "my landlord evicted me without notice",
+        "is it legal for my employer to withhold my salary",
+        "how do i file a complaint about domestic violence",
+    ],
+}
+
+_WORD_RE = re.compile(r"\w+")
+
+def _tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+class QueryClassifier:
+    """Tiny TF-IDF nearest-centroid classifier; runs locally with no network calls"""
+
+    def __init__(self, examples: Dict[str, List[str]]):
+        docs = [(label, Counter(_tokenize(text))) for label, texts in examples.items() for text in texts]
+        doc_freq = Counter(term for _, counts in docs for term in counts)
+        self.idf = {term: math.log((1 + len(docs)) / (1 + df)) + 1 for term, df in doc_freq.items()}
+        self.centroids: Dict[str, Dict[str, float]] = {}
+        for label in examples:
+            centroid: Counter = Counter()
+            for doc_label, counts in docs:
+                if doc_label == label:
+                    centroid.update(self._vector(counts))
+            self.centroids[label] = self._normalize(centroid)
+
+    def _vector(self, counts: Counter) -> Dict[str, float]:
+        return self._normalize({term: count * self.idf[term] for term, count in counts.items() if term in self.idf})
+
+    @staticmethod
+    def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        return {term: v / norm for term, v in vector.items()} if norm else {}
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Cosine similarity of the text to each class centroid"""
+        vector = self._vector(Counter(_tokenize(text)))
+        return {
+            label: sum(weight * centroid.get(term, 0.0) for term, weight in vector.items())
+            for label, centroid in self.centroids.items()
+        }
+
+classifier = QueryClassifier(_SEED_EXAMPLES)
+
+@dataclass(frozen=True)
+class RouteDecision:
+    route: str
+    model: Optional[str]
+    scores: Dict[str, float]
+
+def classify_case(description: str) -> RouteDecision:
+    """Decide whether a legal-advice request needs the LLM or a directory lookup.
+
+    Only short, clearly directory-style questions skip the LLM; anything that
+    describes what happened to someone gets full legal advice.
+    """
+    scores = classifier.scores(description)
+    if (
+        ROUTING_ENABLED
+        and len(_tokenize(description)) <= DIRECTORY_MAX_WORDS
+        and not CASE_FACT_RE.search(description)
+        and scores[ROUTE_LEGAL] < DIRECTORY_MAX_LEGAL_SCORE
+        and scores[ROUTE_DIRECTORY] - scores[ROUTE_LEGAL] >= DIRECTORY_MIN_MARGIN
+    ):
+        return RouteDecision(ROUTE_DIRECTORY, None, scores)
+    return RouteDecision(ROUTE_LEGAL, ROUTE_MODELS[ROUTE_LEGAL], scores)
+
+# Questions whose route must not change when the seeds or thresholds are tuned
+ROUTING_CHECKS = [
+    ("where is the nearest shelter", ROUTE_DIRECTORY),
+    ("phone number for legal aid in Amhara", ROUTE_DIRECTORY),
+    ("where can i get free legal aid", ROUTE_DIRECTORY),
+    ("find a lawyer near me", ROUTE_DIRECTORY),
+    ("I was raped, who can I call for help near me", ROUTE_LEGAL),
+    ("My husband beats me. Where is the nearest shelter?", ROUTE_LEGAL),
+    ("My boss touches me, where can I report?", ROUTE_LEGAL),
+    ("Someone threatens to kill me, which organization can help?", ROUTE_LEGAL),
+    ("can i get custody of my children", ROUTE_LEGAL),
+]
+
+def check_routing() -> List[str]:
+    """Run ROUTING_CHECKS and describe every question that is routed wrongly"""
+    problems = []
+    for question, expected in ROUTING_CHECKS:
+        decision = classify_case(question)
+        if decision.route != expected:
+            problems.append(f"{question!r} routed to {decision.route}, expected {expected} (scores {decision.scores})")
+    return problems
+
+if ROUTING_ENABLED:
+    for problem in check_routing():
+        logger.warning("Routing check failed: %s", problem)
+
+def detect_region(text: str) -> Optional[str]:
+    """Find an Ethiopian region mentioned in free text"""
+    lowered = text.lower()
+    for region in ETHIOPIAN_REGIONS:
+        if region in lowered:
+            return region
+    return None
+
+def rank_organizations(organizations: List[Dict[str, Any]], description: str) -> List[Dict[str, Any]]:
+    """Order organizations by how many of their services are mentioned in the question"""
+    words = set(_tokenize(description))
+    def overlap(org: Dict[str, Any]) -> int:
+        services = " ".join(org.get("services") or [])
+        return len(words & set(_tokenize(services)))
+    return sorted(organizations, key=overlap, reverse=True)
+
+def format_directory_answer(organizations: List[Dict[str, Any]], region: Optional[str]) -> str:
+    """Render organizations in the same plain-text style as the AI advice"""
+    if not organizations:
+        where = f" in {region.title()}" if region else ""
+        return (
+            f"SUPPORT ORGANIZATIONS:\nWe could not find a listed organization{where}. "
+            "Please check the Support Directory page or describe your situation for legal guidance."
+        )
+    lines = ["SUPPORT ORGANIZATIONS:"]
+    for org in organizations:
+        lines.append(f"- {org['name']} ({org['region']})")
+        if org.get("services"):
+            lines.append(f"  Services: {', '.join(org['services'])}")
+        lines.append(f"  Contact: {org['contact']}")
+        lines.append(f"  Address: {org['address']}")
+        if org.get("website"):
+            lines.append(f"  Website: {org['website']}")
+    return "\n".join(lines)
+
+class RoutingMetrics:
+    """In-process counters for routing decisions and per-route latency"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self._latency_ms: Counter = Counter()
+
+    def record(self, route: str, latency_ms: float):
+        with self._lock:
+            self._counts[route] += 1
+            self._latency_ms[route] += latency_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+            latency = dict(self._latency_ms)
+        avg = {route: latency[route] / counts[route] for route in counts}
+        # Each directory answer saved roughly one average LLM call
+        saved = 0.0
+        if ROUTE_DIRECTORY in avg and ROUTE_LEGAL in avg:
+            saved = counts[ROUTE_DIRECTORY] * max(avg[ROUTE_LEGAL] - avg[ROUTE_DIRECTORY], 0.0)
+        return {
+            "decisions": counts,
+            "avg_latency_ms": avg,
+            "llm_calls_avoided": counts.get(ROUTE_DIRECTORY, 0),
+            "estimated_latency_saved_ms": saved,
+            "models": ROUTE_MODELS,
+        }
+
+routing_metrics = RoutingMetrics()
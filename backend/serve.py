@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Production launcher for the Netsanet API.
+
+    python serve.py --workers 4
+
+Uses gunicorn with uvicorn workers when gunicorn is installed, so the app and
+its read-only data (compiled prompt templates, the routing classifier) are
+loaded once in the master and shared copy-on-write by the workers. Without
+gunicorn it falls back to uvicorn's own process manager, where each worker
+loads the app itself.
+
+On SIGTERM, workers stop accepting connections, let in-flight requests finish
+and wait for running Gemini calls before exiting. Both share one GRACEFUL_TIMEOUT
+budget, after which gunicorn kills the worker.
+
+Events (admin WebSocket pushes, feed updates) and request deduplication are per
+process unless EVENT_BROKER_URL points to Redis, so more than one worker without
+it is refused; pass --allow-local-events to start anyway.
+"""
+
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import sys
+from typing import Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds of the shutdown budget kept back so the worker exits before gunicorn kills it
+SHUTDOWN_MARGIN_SECONDS = 2
+
+def _has(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def _is_redis(url: str) -> bool:
+    return url.startswith(("redis://", "rediss://"))
+
+def default_workers() -> int:
+    # Most time is spent waiting on Gemini and Supabase, so a worker per core is a good
+    # start, but only with a shared broker; otherwise a single worker is the working default
+    if _is_redis(os.getenv("EVENT_BROKER_URL", "")):
+        return int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+    return int(os.getenv("WEB_CONCURRENCY", "1"))
+
+def shutdown_budget(graceful_timeout: int) -> Tuple[int, int]:
+    """Split one graceful timeout into (seconds for open requests, seconds for the AI drain)"""
+    usable = max(0, graceful_timeout - SHUTDOWN_MARGIN_SECONDS)
+    drain = usable // 4
+    return usable - drain, drain
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the Netsanet API in production")
+    parser.add_argument("--app", default="main:app", help="ASGI app to serve, as module:attribute")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--loop", default=os.getenv("UVICORN_LOOP", "uvloop" if _has("uvloop") else "asyncio"),
+                        choices=["asyncio", "uvloop"])
+    parser.add_argument("--http", default=os.getenv("UVICORN_HTTP", "httptools" if _has("httptools") else "h11"),
+                        choices=["h11", "httptools"])
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE_SECONDS", "5")),
+                        help="Seconds to hold idle keep-alive connections open")
+    parser.add_argument("--backlog", type=int, default=int(os.getenv("BACKLOG", "2048")),
+                        help="Maximum number of pending connections")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "60")),
+                        help="Seconds to wait for in-flight requests and Gemini calls on shutdown")
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("MAX_REQUESTS", "0")),
+                        help="Restart a worker after this many requests (0 disables)")
+    parser.add_argument("--allow-local-events", action="store_true",
+                        default=os.getenv("ALLOW_LOCAL_EVENTS", "").lower() in ("1", "true", "yes"),
+                        help="Run several workers without EVENT_BROKER_URL (events and dedup stay per worker)")
+    parser.add_argument("--no-gunicorn", action="store_true", help="Use uvicorn's process manager even if gunicorn is installed")
+    return parser.parse_args(argv)
+
+def _uvicorn_worker_class(loop: str, http: str, graceful_shutdown: int) -> type:
+    try:
+        from uvicorn_worker import UvicornWorker
+    except ImportError:
+        from uvicorn.workers import UvicornWorker
+
+    class NetsanetWorker(UvicornWorker):
+        CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, "loop": loop, "http": http,
+                         "timeout_graceful_shutdown": graceful_shutdown}
+
+    return NetsanetWorker
+
+def run_gunicorn(args: argparse.Namespace):
+    from gunicorn.app.base import BaseApplication
+
+    worker_class = _uvicorn_worker_class(args.loop, args.http, shutdown_budget(args.graceful_timeout)[0])
+
+    class NetsanetApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{args.host}:{args.port}",
+                "workers": args.workers,
+                "worker_class": worker_class,
+                "keepalive": args.keep_alive,
+                "backlog": args.backlog,
+                "graceful_timeout": args.graceful_timeout,
+                # Workers may legitimately sit on a slow Gemini call for a while
+                "timeout": args.graceful_timeout + 30,
+                "max_requests": args.max_requests,
+                "max_requests_jitter": args.max_requests // 10,
+                # Import the app in the master so workers share its read-only state
+                "preload_app": True,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from uvicorn.importer import import_from_string
+            return import_from_string(args.app)
+
+    NetsanetApplication().run()
+
+def run_uvicorn(args: argparse.Namespace):
+    import uvicorn
+
+    uvicorn.run(
+        args.app,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        timeout_graceful_shutdown=shutdown_budget(args.graceful_timeout)[0],
+        limit_max_requests=args.max_requests or None,
+        proxy_headers=True,
+    )
+
+def check_event_broker(args: argparse.Namespace):
+    """Refuse several workers without a shared broker, which would split events per worker"""
+    from events import EVENT_BROKER_URL
+    from singleflight import IDEMPOTENCY_REDIS_URL
+    if args.workers <= 1 or _is_redis(EVENT_BROKER_URL):
+        return
+    message = (
+        f"{args.workers} workers without EVENT_BROKER_URL: admin WebSocket events only reach admins on "
+        "the same worker, and other workers' public feeds lag approvals and takedowns by up to FEED_CHECK_SECONDS."
+    )
+    if not _is_redis(IDEMPOTENCY_REDIS_URL):
+        message += " Duplicate AI requests on different workers are not collapsed either (no IDEMPOTENCY_REDIS_URL)."
+    if not args.allow_local_events:
+        sys.exit(f"ERROR: {message}\nSet EVENT_BROKER_URL=redis://..., use --workers 1, or pass --allow-local-events.")
+    print(f"WARNING: {message}", file=sys.stderr)
+
+def main(argv=None):
+    args = parse_args(argv)
+    check_event_broker(args)
+    # Read by the app's shutdown handler, so the AI drain fits in what is left of the budget
+    os.environ["AI_DRAIN_SECONDS"] = str(shutdown_budget(args.graceful_timeout)[1])
+    print(f"Netsanet API: {args.workers} worker(s), loop={args.loop}, http={args.http}, "
+          f"keep-alive={args.keep_alive}s, backlog={args.backlog}")
+    if _has("gunicorn") and not args.no_gunicorn:
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# How long a finished result is replayed for duplicates and Idempotency-Key retries
+IDEMPOTENCY_WINDOW_SECONDS = float(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "300"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+# Redis shared by all workers; defaults to the event broker. Leave both empty for a single worker
+IDEMPOTENCY_REDIS_URL = os.getenv("IDEMPOTENCY_REDIS_URL") or os.getenv("EVENT_BROKER_URL", "")
+# How long a worker may hold a key while generating before others may take over
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "120"))
+IDEMPOTENCY_POLL_SECONDS = 0.25
+
+def request_fingerprint(payload: Dict[str, Any]) -> str:
+    """Stable hash of a request body"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class RedisIdempotencyStore:
+    """In-flight markers and finished results shared by every worker through Redis"""
+
+    def __init__(self, url: str, prefix: str = "netsanet:idempotency:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("IDEMPOTENCY_REDIS_URL points to Redis but the 'redis' package is not installed. Run: pip install redis")
+        self._redis = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Tuple[str, Any]]:
+        """(fingerprint, result) of a finished request, if one is stored"""
+        raw = await self._redis.get(self.prefix + "result:" + key)
+        if raw is None:
+            return None
+        stored = json.loads(raw)
+        return stored["fingerprint"], stored["result"]
+
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        """Mark the key in flight; False if another worker already holds it"""
+        return bool(await self._redis.set(self.prefix + "lock:" + key, fingerprint, nx=True, ex=IDEMPOTENCY_LOCK_SECONDS))
+
+    async def holder(self, key: str) -> Optional[str]:
+        """Fingerprint of the request currently holding the key"""
+        raw = await self._redis.get(self.prefix + "lock:" + key)
+        return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+
+    async def put(self, key: str, fingerprint: str, result: Any, ttl: float):
+        payload = json.dumps({"fingerprint": fingerprint, "result": result}, default=str)
+        await self._redis.set(self.prefix + "result:" + key, payload, ex=max(1, int(ttl)))
+        await self.release(key)
+
+    async def release(self, key: str):
+        await self._redis.delete(self.prefix + "lock:" + key)
+
+def create_store(url: str = IDEMPOTENCY_REDIS_URL) -> Optional[RedisIdempotencyStore]:
+    if url.startswith(("redis://", "rediss://")):
+        return RedisIdempotencyStore(url)
+    return None
+
+class SingleFlight:
+    """Collapse concurrent identical requests into one execution and replay recent results.
+
+    The work runs as its own task so a caller that goes away does not cancel it for
+    the others. Within a worker, duplicates join that task; with a shared store,
+    duplicates on other workers wait for its result in Redis instead of generating
+    again. Without a store, duplicates are only collapsed per worker.
+    """
+
+    def __init__(self, window_seconds: float = IDEMPOTENCY_WINDOW_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES,
+                 store: Optional[RedisIdempotencyStore] = None):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.store = store
+        self._inflight: Dict[str, Tuple[str, asyncio.Task]] = {}
+        # key -> (expires_at, fingerprint, result); insertion order is expiry order
+        self._results: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self.stats = {"executed": 0, "joined": 0, "replayed": 0, "joined_remote": 0, "replayed_remote": 0}
+
+    async def do(self, key: str, fingerprint: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn once per key; concurrent and recent callers with the same key share its result"""
+        self._expire()
+        cached = self._results.get(key)
+        if cached:
+            self._check_fingerprint(cached[1], fingerprint)
+            self.stats["replayed"] += 1
+            return cached[2]
+
+        inflight = self._inflight.get(key)
+        if inflight:
+            self._check_fingerprint(inflight[0], fingerprint)
+            self.stats["joined"] += 1
+            task = inflight[1]
+        else:
+            task = asyncio.ensure_future(self._run(key, fingerprint, fn))
+            self._inflight[key] = (fingerprint, task)
+            task.add_done_callback(partial(self._finish, key, fingerprint))
+        return await asyncio.shield(task)
+
+    async def _run(self, key: str, fingerprint: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn, or wait for the worker that already runs it when a shared store is set"""
+        if self.store is None:
+            return await self._execute(fn)
+        waited = False
+        try:
+            while True:
+                stored = await self.store.get(key)
+                if stored:
+                    self._check_fingerprint(stored[0], fingerprint)
+                    self.stats["joined_remote" if waited else "replayed_remote"] += 1
+                    return stored[1]
+                if await self.store.claim(key, fingerprint):
+                    break
+                holder = await self.store.holder(key)
+                if holder is not None:
+                    self._check_fingerprint(holder, fingerprint)
+                    waited = True
+                    # The holder stores its result or releases the key on failure
+                    while await self.store.holder(key) is not None:
+                        await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+        except HTTPException:
+            raise
+        except Exception:
+            # Deduplication is an optimization; never fail a request because Redis is down
+            logger.exception("Shared idempotency store unavailable; running %s locally", key)
+            return await self._execute(fn)
+
+        try:
+            result = await self._execute(fn)
+        except BaseException:
+            await self._quietly(self.store.release(key))
+            raise
+        await self._quietly(self.store.put(key, fingerprint, result, self.window_seconds))
+        return result
+
+    async def _execute(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats["executed"] += 1
+        return await fn()
+
+    @staticmethod
+    async def _quietly(operation: Awaitable[Any]):
+        try:
+            await operation
+        except Exception:
+            logger.exception("Could not update the shared idempotency store")
+
+    async def drain(self, timeout: float) -> int:
+        """Wait up to timeout seconds for in-flight work; returns how many tasks were still running"""
+        tasks = [task for _, task in self._inflight.values()]
+        if not tasks:
+            return 0
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        return len(pending)
+
+    def _finish(self, key: str, fingerprint: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Failures are not remembered, so a retry gets a fresh attempt
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._results[key] = (time.monotonic() + self.window_seconds, fingerprint, task.result())
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._results:
+            key, (expires_at, _, _) = next(iter(self._results.items()))
+            if expires_at > now:
+                break
+            self._results.popitem(last=False)
+
+    @staticmethod
+    def _check_fingerprint(stored: str, fingerprint: str):
+        if stored != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request body"
+            )
+
+def dedup_key(scope: str, user_id: Any, fingerprint: str, idempotency_key: Optional[str] = None) -> str:
+    """Key a request by user and either its Idempotency-Key or its body hash"""
+    if idempotency_key:
+        return f"{scope}:{user_id}:key:{idempotency_key}"
+    return f"{scope}:{user_id}:body:{fingerprint}"
+
+ai_requests = SingleFlight(store=create_store())
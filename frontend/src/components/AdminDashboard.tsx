@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef, useCallback } from 'react';
 import axios from 'axios';
 import {
     Users,
@@ -9,6 +9,7 @@ import {
     Trash2
 } from 'lucide-react';
 import OrganizationManager from './OrganizationManager';
+import { useAuth } from '../contexts/AuthContext';
 
 interface Stats {
     total_stories: number;
@@ -29,6 +30,19 @@ interface PendingStory {
     region: string;
     user_id: number;
     created_at: string;
+    cluster_id?: number;
+    duplicate_of?: number | null;
+    is_spam?: boolean;
+    spam_flags?: string[];
+}
+
+interface ModerationEvent {
+    id?: string;
+    type: 'story.submitted' | 'story.approved' | 'story.rejected' | 'story.deleted';
+    data: {
+        story: PendingStory & { is_approved: boolean };
+        was_approved?: boolean;
+    };
 }
 
 const AdminDashboard = () => {
@@ -36,11 +50,119 @@ const AdminDashboard = () => {
     const [pendingStories, setPendingStories] = useState<PendingStory[]>([]);
     const [loading, setLoading] = useState(true);
     const [activeTab, setActiveTab] = useState('overview');
+    const { token } = useAuth();
+    // Our own actions already applied locally; each entry is dropped once its pushed echo arrives
+    const pendingEchoes = useRef(new Set<string>());
 
     useEffect(() => {
         fetchData();
     }, []);
 
+    // Apply a moderation event as an incremental update instead of reloading everything
+    const applyEvent = useCallback((event: ModerationEvent, local = false) => {
+        const story = event.data.story;
+        const key = `${event.type}:${story.id}`;
+        if (local) {
+            pendingEchoes.current.add(key);
+        } else if (pendingEchoes.current.delete(key)) {
+            return;
+        }
+
+        const wasApproved = event.data.was_approved ?? story.is_approved;
+        switch (event.type) {
+            case 'story.submitted':
+                setPendingStories(prev => {
+                    if (prev.some(s => s.id === story.id)) {
+                        return prev;
+                    }
+                    // Flags are stored at submission; a duplicate of a pending story joins its cluster
+                    const original = prev.find(s => s.id === story.duplicate_of);
+                    return [...prev, {
+                        ...story,
+                        cluster_id: original ? original.cluster_id ?? original.id : story.id,
+                        duplicate_of: original ? null : story.duplicate_of
+                    }];
+                });
+                setStats(prev => prev && {
+                    ...prev,
+                    total_stories: prev.total_stories + 1,
+                    pending_stories: prev.pending_stories + 1
+                });
+                break;
+            case 'story.approved':
+                setPendingStories(prev => prev.filter(s => s.id !== story.id));
+                if (!wasApproved) {
+                    setStats(prev => prev && {
+                        ...prev,
+                        approved_stories: prev.approved_stories + 1,
+                        pending_stories: prev.pending_stories - 1
+                    });
+                }
+                break;
+            case 'story.rejected':
+                setPendingStories(prev => prev.filter(s => s.id !== story.id));
+                setStats(prev => prev && {
+                    ...prev,
+                    approved_stories: prev.approved_stories - (wasApproved ? 1 : 0),
+                    pending_stories: prev.pending_stories - (wasApproved ? 0 : 1)
+                });
+                break;
+            case 'story.deleted':
+                setPendingStories(prev => prev.filter(s => s.id !== story.id));
+                setStats(prev => prev && {
+                    ...prev,
+                    total_stories: prev.total_stories - 1,
+                    approved_stories: prev.approved_stories - (wasApproved ? 1 : 0),
+                    pending_stories: prev.pending_stories - (wasApproved ? 0 : 1)
+                });
+                break;
+        }
+    }, []);
+
+    useEffect(() => {
+        if (!token) {
+            return;
+        }
+        let socket: WebSocket | null = null;
+        let retryTimer: ReturnType<typeof setTimeout> | undefined;
+        let delay = 1000;
+        let closed = false;
+
+        // Reconnect with backoff after a worker restart or network drop, then reload
+        // the list so events missed while disconnected are not lost
+        const connect = (isReconnect: boolean) => {
+            socket = new WebSocket(`ws://localhost:8000/admin/events?token=${encodeURIComponent(token)}`);
+            socket.onopen = () => {
+                delay = 1000;
+                if (isReconnect) {
+                    pendingEchoes.current.clear();
+                    fetchData();
+                }
+            };
+            socket.onmessage = (message) => {
+                try {
+                    applyEvent(JSON.parse(message.data));
+                } catch (error) {
+                    console.error('Error handling moderation event:', error);
+                }
+            };
+            socket.onclose = () => {
+                if (closed) {
+                    return;
+                }
+                retryTimer = setTimeout(() => connect(true), delay);
+                delay = Math.min(delay * 2, 30000);
+            };
+        };
+        connect(false);
+
+        return () => {
+            closed = true;
+            clearTimeout(retryTimer);
+            socket?.close();
+        };
+    }, [token, applyEvent]);
+
     const fetchData = async () => {
         try {
             const [statsResponse, pendingResponse] = await Promise.all([
@@ -57,6 +179,36 @@ const AdminDashboard = () => {
         }
     };
 
+    // Update the list and stats for our own action without waiting for the pushed event
+    const applyLocal = (type: ModerationEvent['type'], storyId: number) => {
+        const story = pendingStories.find(s => s.id === storyId);
+        if (story) {
+            applyEvent({ type, data: { story: { ...story, is_approved: false }, was_approved: false } }, true);
+        }
+    };
+
+    // Stories sharing a near-duplicate cluster can be deleted with one action
+    const clusterOf = (story: PendingStory) =>
+        pendingStories.filter(s => s.cluster_id !== undefined && s.cluster_id === story.cluster_id);
+
+    const deleteCluster = async (story: PendingStory) => {
+        const storyIds = clusterOf(story).map(s => s.id);
+        if (!confirm(`Delete all ${storyIds.length} similar stories? This action cannot be undone.`)) {
+            return;
+        }
+
+        try {
+            await axios.post('http://localhost:8000/admin/stories/cluster-action', {
+                story_ids: storyIds,
+                action: 'delete'
+            });
+            storyIds.forEach(id => applyLocal('story.deleted', id));
+        } catch (error) {
+            console.error('Error deleting story group:', error);
+            alert('Error deleting story group. Please try again.');
+        }
+    };
+
     const approveStory = async (storyId: number) => {
         try {
             await axios.post(`http://localhost:8000/admin/stories/approve`, {
@@ -64,15 +216,7 @@ const AdminDashboard = () => {
                 approved: true
             });
 
-            // Remove from pending list and update stats
-            setPendingStories(prev => prev.filter(story => story.id !== storyId));
-            if (stats) {
-                setStats({
-                    ...stats,
-                    approved_stories: stats.approved_stories + 1,
-                    pending_stories: stats.pending_stories - 1
-                });
-            }
+            applyLocal('story.approved', storyId);
 
             alert('Story approved successfully!');
         } catch (error) {
@@ -88,14 +232,7 @@ const AdminDashboard = () => {
                 approved: false
             });
 
-            // Remove from pending list and update stats
-            setPendingStories(prev => prev.filter(story => story.id !== storyId));
-            if (stats) {
-                setStats({
-                    ...stats,
-                    pending_stories: stats.pending_stories - 1
-                });
-            }
+            applyLocal('story.rejected', storyId);
 
             alert('Story rejected successfully!');
         } catch (error) {
@@ -112,14 +249,7 @@ const AdminDashboard = () => {
         try {
             await axios.delete(`http://localhost:8000/admin/stories/${storyId}`);
 
-            // Remove from pending list and update stats
-            setPendingStories(prev => prev.filter(story => story.id !== storyId));
-            if (stats) {
-                setStats({
-                    ...stats,
-                    pending_stories: stats.pending_stories - 1
-                });
-            }
+            applyLocal('story.deleted', storyId);
 
             alert('Story deleted successfully!');
         } catch (error) {
@@ -277,6 +407,21 @@ const AdminDashboard = () => {
                                                     <span className="bg-gray-100 px-2 py-1 rounded">{story.category}</span>
                                                     <span>{story.region}</span>
                                                     <span>User ID: {story.user_id}</span>
+                                                    {clusterOf(story).length > 1 && (
+                                                        <span className="bg-yellow-100 text-yellow-800 px-2 py-1 rounded">
+                                                            {clusterOf(story).length} similar
+                                                        </span>
+                                                    )}
+                                                    {story.duplicate_of && (
+                                                        <span className="bg-yellow-100 text-yellow-800 px-2 py-1 rounded">
+                                                            Duplicate of #{story.duplicate_of}
+                                                        </span>
+                                                    )}
+                                                    {story.is_spam && (
+                                                        <span className="bg-red-100 text-red-800 px-2 py-1 rounded" title={story.spam_flags?.join(', ')}>
+                                                            Possible spam
+                                                        </span>
+                                                    )}
                                                 </div>
                                             </div>
                                             <div className="ml-4 flex-shrink-0 flex space-x-2">
@@ -293,6 +438,15 @@ const AdminDashboard = () => {
                                                 >
                                                     Reject
                                                 </button>
+                                                {clusterOf(story).length > 1 && (
+                                                    <button
+                                                        onClick={() => deleteCluster(story)}
+                                                        className="bg-gray-800 hover:bg-gray-900 text-white px-3 py-1 rounded text-sm flex items-center"
+                                                    >
+                                                        <Trash2 className="w-4 h-4 mr-1" />
+                                                        Delete group
+                                                    </button>
+                                                )}
                                                 <button
                                                     onClick={() => deleteStory(story.id)}
                                                     className="bg-gray-600 hover:bg-gray-700 text-white px-3 py-1 rounded text-sm flex items-center"
@@ -1,4 +1,4 @@
-import { useState } from 'react';
+import { useState, useRef } from 'react';
 import { FileText, Send, Copy, Download, Edit, Eye } from 'lucide-react';
 import axios from 'axios';
 import ReactMarkdown from 'react-markdown';
@@ -19,6 +19,8 @@ const AppealGenerator = () => {
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState('');
     const [editMode, setEditMode] = useState<'english' | 'amharic' | null>(null);
+    // Retries of the same submission reuse its Idempotency-Key so the server replays the result
+    const submission = useRef({ body: '', key: '' });
 
     const caseTypes = [
         'domestic_violence',
@@ -52,8 +54,15 @@ const AppealGenerator = () => {
         setError('');
         setIsGenerated(false);
 
+        const body = JSON.stringify(formData);
+        if (submission.current.body !== body) {
+            submission.current = { body, key: crypto.randomUUID() };
+        }
+
         try {
-            const response = await axios.post('http://localhost:8000/api/generate-appeal', formData);
+            const response = await axios.post('http://localhost:8000/api/generate-appeal', formData, {
+                headers: { 'Idempotency-Key': submission.current.key }
+            });
 
             // Parse the response to separate English and Amharic versions
             const appealText = response.data.appeal_letter;
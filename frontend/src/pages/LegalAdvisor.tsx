@@ -1,4 +1,4 @@
-import { useState } from 'react';
+import { useState, useRef } from 'react';
 import { MessageSquare, Send, Copy, Download } from 'lucide-react';
 import axios from 'axios';
 import ReactMarkdown from 'react-markdown';
@@ -9,6 +9,8 @@ const LegalAdvisor = () => {
     const [advice, setAdvice] = useState('');
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState('');
+    // Retries of the same submission reuse its Idempotency-Key so the server replays the result
+    const submission = useRef({ body: '', key: '' });
 
     const regions = [
         'Addis Ababa',
@@ -30,10 +32,18 @@ const LegalAdvisor = () => {
         setError('');
         setAdvice('');
 
+        const payload = {
+            description,
+            region: region || null
+        };
+        const body = JSON.stringify(payload);
+        if (submission.current.body !== body) {
+            submission.current = { body, key: crypto.randomUUID() };
+        }
+
         try {
-            const response = await axios.post('http://localhost:8000/api/legal-advice', {
-                description,
-                region: region || null
+            const response = await axios.post('http://localhost:8000/api/legal-advice', payload, {
+                headers: { 'Idempotency-Key': submission.current.key }
             });
 
             setAdvice(response.data.advice);